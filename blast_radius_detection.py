@@ -1,46 +1,234 @@
+import os
+import time
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
 
 codebase_map = f'./.momentum/momentum.db'
 
-from simple_graph_sqlite import database as graph
+from graph_writer import table_exists
+from impact_table import decode_endpoint_ids
+from csr_snapshot import open_snapshot
 
 
-def find_entry_points( identifiers, directory):
-    all_inbound_nodes = set()
-    codebase_map = f'{directory}/.momentum/momentum.db'
-    for identifier in identifiers:
-        traversal_result = graph.traverse(codebase_map, identifier, neighbors_fn=graph.find_inbound_neighbors)
-        all_inbound_nodes.update(traversal_result)
+def load_inbound_adjacency(conn):
+    # target -> set of callers, read with one scan of the edges table
+    callers = {}
+    for source, target in conn.execute("SELECT source, target FROM edges"):
+        callers.setdefault(target, set()).add(source)
+    return callers
+
+
+def select_in(conn, query, identifiers):
+    # Run query with its "{}" replaced by placeholders for a chunk of identifiers at a time,
+    # staying under SQLite's bound parameter limit
+    identifiers = list(set(identifiers))
+    rows = []
+    for start in range(0, len(identifiers), 500):
+        chunk = identifiers[start:start + 500]
+        rows.extend(conn.execute(query.format(",".join("?" * len(chunk))), chunk))
+    return rows
+
+
+def existing_nodes(conn, identifiers):
+    return {row[0] for row in select_in(conn, "SELECT id FROM nodes WHERE id IN ({})", identifiers)}
+
+
+def load_component_callers(conn):
+    # Inbound adjacency of the condensed graph, component -> calling components
+    callers = {}
+    for source, target in conn.execute("SELECT source, target FROM scc_edges"):
+        callers.setdefault(target, set()).add(source)
+    return callers
+
+
+def reverse_reachable(starts, callers_of, max_nodes=None, max_depth=None, deadline=None):
+    # Level by level breadth-first search over the reversed graph from all starts at once.
+    # It stops early once max_nodes nodes are reached, max_depth levels of callers are
+    # expanded or the time.monotonic() deadline passes, and only then reports partial=True.
+    # A deadline that passes once nothing is left to expand still gives a complete result.
+    reached = set(starts)
+    frontier = list(starts)
+    depth = 0
+    while frontier:
+        next_frontier = []
+        for position, node in enumerate(frontier):
+            if deadline is not None and time.monotonic() > deadline:
+                unexpanded = frontier[position:] + next_frontier
+                return reached, any(caller not in reached for node in unexpanded for caller in callers_of(node))
+            for caller in callers_of(node):
+                if caller in reached:
+                    continue
+                if (max_depth is not None and depth >= max_depth) or (max_nodes is not None and len(reached) >= max_nodes):
+                    return reached, True
+                reached.add(caller)
+                next_frontier.append(caller)
+        frontier = next_frontier
+        depth += 1
+    return reached, False
+
+
+class BlastRadiusQueries:
+    """Read-only query layer over one momentum.db. Connections are opened lazily up to
+    pool_size and handed out one job at a time, and every query records its elapsed
+    time in timings as name -> [calls, total seconds, slowest seconds]."""
+
+    def __init__(self, directory, pool_size=4):
+        self.directory = directory
+        self.db_path = f'{directory}/.momentum/momentum.db'
+        self.pool_size = pool_size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.closed = False
+
+    def _connect(self):
+        return sqlite3.connect(f"file:{pathname2url(self.db_path)}?mode=ro", uri=True, check_same_thread=False)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self.lock:
+                if self.opened < self.pool_size:
+                    conn = self._connect()
+                    self.opened += 1
+            if conn is None:
+                # Every connection is busy, wait for one to come back
+                conn = self.idle.get()
+        if conn is None:
+            # The layer was closed, so this job gets a connection of its own
+            with self.lock:
+                conn = self._connect()
+                self.opened += 1
+        try:
+            yield conn
+        finally:
+            with self.lock:
+                # Connections checked out when the layer was closed are closed on return,
+                # and None wakes a job that is still waiting for one
+                if self.closed:
+                    conn.close()
+                    self.opened -= 1
+                    self.idle.put(None)
+                else:
+                    self.idle.put(conn)
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+                timing[2] = max(timing[2], elapsed)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            while not self.idle.empty():
+                conn = self.idle.get_nowait()
+                if conn is not None:
+                    conn.close()
+                    self.opened -= 1
+
+    def entry_points(self, identifiers, max_nodes=None, max_depth=None, deadline=None):
+        # Entry points reachable from identifiers and whether a budget cut the traversal short.
+        # On the condensed graph nodes and depth count components.
+        limits = {"max_nodes": max_nodes, "max_depth": max_depth, "deadline": deadline}
+        with self.timed("entry_points"):
+            # The memory mapped snapshot written at the end of indexing answers without touching SQLite
+            with open_snapshot(self.directory) as snapshot:
+                if snapshot is not None:
+                    reached, partial = reverse_reachable(snapshot.components_of(identifiers), snapshot.component_callers, **limits)
+                    return snapshot.root_members(reached), partial
+            with self.connection() as conn:
+                if table_exists(conn, "scc"):
+                    # Walk the condensed DAG: cycles collapse into one component and are visited once.
+                    # Only identifiers that are nodes have a component and start the traversal.
+                    starts = {row[0] for row in select_in(conn, "SELECT component FROM scc WHERE id IN ({})", identifiers)}
+                    callers = load_component_callers(conn)
+                    reached, partial = reverse_reachable(starts, lambda component: callers.get(component, ()), **limits)
+                    # Every member of a component nothing else calls is an entry point
+                    return {row[0] for row in select_in(conn, "SELECT scc.id FROM scc JOIN node_degrees ON node_degrees.id = scc.id WHERE is_root = 1 AND component IN ({})", reached)}, partial
+
+                # Indexes built before the condensed graph existed
+                callers = load_inbound_adjacency(conn)
+                all_inbound_nodes, partial = reverse_reachable(existing_nodes(conn, identifiers), lambda node: callers.get(node, ()), **limits)
+                # An entry point has no callers other than itself, which the index stores as is_root
+                if table_exists(conn, "node_degrees"):
+                    return {row[0] for row in select_in(conn, "SELECT id FROM node_degrees WHERE is_root = 1 AND id IN ({})", all_inbound_nodes)}, partial
+                return {node for node in all_inbound_nodes if callers.get(node, set()) <= {node}}, partial
+
+    def impacted_endpoints(self, identifiers):
+        # Union of the identifiers' rows in the impact table, or None when the index has no impact table
+        with self.connection() as conn, self.timed("impacted_endpoints"):
+            if not table_exists(conn, "impact"):
+                return None
+            endpoint_bits = 0
+            for (endpoints,) in select_in(conn, "SELECT endpoints FROM impact WHERE id IN ({})", identifiers):
+                endpoint_bits |= int.from_bytes(endpoints, "little")
+            return {row[0] for row in select_in(conn, "SELECT identifier FROM impact_endpoints WHERE endpoint_id IN ({})", decode_endpoint_ids(endpoint_bits))}
+
+    def paths(self, entry_points):
+        # identifier -> endpoint path for every entry point that is an endpoint
+        with self.connection() as conn, self.timed("paths"):
+            return dict(select_in(conn, "SELECT identifier, path FROM endpoints WHERE identifier IN ({})", entry_points))
+
+    def has_table(self, name):
+        with self.connection() as conn:
+            return table_exists(conn, name)
+
 
-    entry_points = set()
-    for node in all_inbound_nodes:
+_open_queries = {}
+_open_queries_lock = threading.Lock()
 
-        inbound_to_node = set(graph.traverse(codebase_map, node, neighbors_fn=graph.find_inbound_neighbors))
-        if len(inbound_to_node)==1 and inbound_to_node == {node}:
-            entry_points.add(node)
 
+def open_queries(directory, max_open=8):
+    # One query layer per index, reused across jobs until the database file is replaced.
+    # Only the max_open most recently used indexes keep their connections open.
+    db_path = f'{directory}/.momentum/momentum.db'
+    stat = os.stat(db_path)
+    key = (stat.st_ino, stat.st_mtime_ns)
+    with _open_queries_lock:
+        cached = _open_queries.pop(db_path, None)
+        if cached is not None and cached[0] != key:
+            cached[1].close()
+            cached = None
+        if cached is None:
+            cached = (key, BlastRadiusQueries(directory))
+        _open_queries[db_path] = cached
+        while len(_open_queries) > max_open:
+            _open_queries.pop(next(iter(_open_queries)))[1].close()
+    return cached[1]
+
+
+def find_entry_points( identifiers, directory):
+    entry_points, _ = find_entry_points_bounded(identifiers, directory)
     return entry_points
 
 
+def find_entry_points_bounded(identifiers, directory, max_nodes=None, max_depth=None, deadline=None):
+    return open_queries(directory).entry_points(identifiers, max_nodes, max_depth, deadline)
+
+
+def find_impacted_endpoints(identifiers, directory):
+    return open_queries(directory).impacted_endpoints(identifiers)
+
+
 def find_paths(entry_points, directory):
-    # Connect to the endpoints database
-    conn_endpoints = sqlite3.connect(f'{directory}/.momentum/momentum.db')
-    endpoints_cursor = conn_endpoints.cursor()
-    
-    paths = {}
-    
-    for entry_point in entry_points:
-        endpoints_cursor.execute("SELECT path FROM endpoints WHERE identifier = ?", (entry_point,))
-        path = endpoints_cursor.fetchone()
-        if path:
-            paths[entry_point] = path[0]
-    
-    conn_endpoints.close()
-    return paths
+    return open_queries(directory).paths(entry_points)
 
-def get_paths_from_identifiers(identifiers, temp_dir):
-    entry_points = find_entry_points(identifiers,temp_dir)
-    paths = find_paths(entry_points, temp_dir)
+def group_paths_by_file(paths):
     grouped_by_filename = {}
     for entry_point, path in paths.items():
         file, function = entry_point.split(':')
@@ -48,3 +236,48 @@ def get_paths_from_identifiers(identifiers, temp_dir):
             grouped_by_filename[file] = []
         grouped_by_filename[file].append({"entryPoint": path, "identifier": entry_point})
     return grouped_by_filename
+
+def get_paths_from_identifiers(identifiers, temp_dir):
+    entry_points = find_impacted_endpoints(identifiers, temp_dir)
+    if entry_points is None:
+        entry_points = find_entry_points(identifiers,temp_dir)
+    paths = find_paths(entry_points, temp_dir)
+    return group_paths_by_file(paths)
+
+def get_bounded_paths_from_identifiers(identifiers, temp_dir, max_nodes=None, max_depth=None, timeout=None):
+    # Like get_paths_from_identifiers, but the traversal stops at a node budget, a depth limit or
+    # after timeout seconds. Returns the grouped paths found so far and whether they are partial.
+    entry_points = find_impacted_endpoints(identifiers, temp_dir)
+    partial = False
+    if entry_points is None:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        entry_points, partial = find_entry_points_bounded(identifiers, temp_dir, max_nodes, max_depth, deadline)
+    paths = find_paths(entry_points, temp_dir)
+    return group_paths_by_file(paths), partial
+
+def get_paths_from_change_sets(change_sets, temp_dir):
+    # change_sets maps a label (e.g. a PR number) to its changed identifiers. Returns
+    # label -> the result get_paths_from_identifiers would give for that set, from one pass.
+    with open_snapshot(temp_dir) as snapshot:
+        if open_queries(temp_dir).has_table("impact") or snapshot is None:
+            return {label: get_paths_from_identifiers(identifiers, temp_dir) for label, identifiers in change_sets.items()}
+        entry_points = snapshot.find_entry_points_batch(change_sets)
+    paths = find_paths(set().union(*entry_points.values()), temp_dir)
+    return {
+        label: group_paths_by_file({entry_point: paths[entry_point] for entry_point in label_entry_points if entry_point in paths})
+        for label, label_entry_points in entry_points.items()
+    }
+
+
+def parse_blast_radius(blast_radius, partial=False):
+    markdown_output = "| Filename | Entry Point |\n"
+    markdown_output += "| --- | --- |\n"
+    
+    for filename, endpoints in blast_radius.items():
+        for endpoint in endpoints:
+            entry_point = endpoint["entryPoint"]
+            markdown_output += f"| {filename} | {entry_point} |\n"
+    
+    if partial:
+        markdown_output += "\n**Partial result:** the traversal stopped at its size or time budget, so more entry points may be affected.\n"
+    return markdown_output
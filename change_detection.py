@@ -1,6 +1,10 @@
 import subprocess
 import os
+import json
+import bisect
+import sqlite3
 from itertools import islice
+from urllib.request import pathname2url
 # from tree_sitter import Language, Parser
 # # Load Python grammar for Tree-sittefrom tree_sitter import Language, Parser
 
@@ -27,6 +31,7 @@ def _get_git_diff_detail(base_branch, head_branch, repo, pull):
 
 
 def _parse_diff_detail(diff_detail, repo_path):
+    # file -> (start, end) line ranges of its hunks on the new side, end exclusive
     changed_files = {}
     current_file = None
     for line in diff_detail.split('\n'):
@@ -34,15 +39,72 @@ def _parse_diff_detail(diff_detail, repo_path):
             relative_file_path = line.split('+++ b/')[1].strip()
            
             current_file = os.path.normpath(os.path.join(repo_path, relative_file_path))
-            changed_files[current_file] = set()
+            changed_files[current_file] = []
         elif line.startswith('@@'):
             parts = line.split()
             add_start_line, add_num_lines = map(int, parts[2][1:].split(',')) if ',' in parts[2] else (int(parts[2][1:]), 1)
-            for i in range(add_start_line, add_start_line + add_num_lines -1):
-                changed_files[current_file].add(i)
+            if add_num_lines > 1:
+                changed_files[current_file].append((add_start_line, add_start_line + add_num_lines - 1))
     return changed_files
 
 
+def _merge_ranges(ranges):
+    # Sorted, non overlapping (start, end) ranges covering the same lines
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _overlapping_functions(functions, ranges):
+    # functions are (start_line, end_line, name) with inclusive lines, ranges come from _merge_ranges.
+    # The first range ending after a function's start is the only one that can overlap it.
+    range_ends = [end for _, end in ranges]
+    changed = []
+    for start_line, end_line, name in functions:
+        position = bisect.bisect_right(range_ends, start_line)
+        if position < len(ranges) and ranges[position][0] <= end_line:
+            changed.append(name)
+    return changed
+
+
+def _load_indexed_functions(repo_path, internal_paths):
+    # Line ranges of the functions, methods and classes analyze_directory stored for each file, keyed
+    # by internal path, for the files the index covers. Node ids are "<internal path>:<name>", so a
+    # file's nodes are one range scan over the id index.
+    db_path = os.path.join(repo_path, ".momentum", "momentum.db")
+    if not os.path.exists(db_path):
+        return {}
+    conn = sqlite3.connect(f"file:{pathname2url(db_path)}?mode=ro", uri=True)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files'").fetchone() is None:
+            return {}
+        indexed = {}
+        for internal_path in internal_paths:
+            if conn.execute("SELECT 1 FROM files WHERE filepath = ?", (internal_path,)).fetchone() is None:
+                continue
+            functions = []
+            for identifier, start, end in conn.execute(
+                "SELECT id, json_extract(body, '$.start'), json_extract(body, '$.end') FROM nodes WHERE id >= ? AND id < ?",
+                (internal_path + ":", internal_path + ";"),
+            ):
+                # Nodes only upserted with an endpoint's response have no line range
+                if start is None or end is None:
+                    continue
+                # Functions store their first and last row, classes a [row, column] point, both zero based
+                start, end = (json.loads(value)[0] if isinstance(value, str) else value for value in (start, end))
+                functions.append((start + 1, end + 1, identifier[len(internal_path) + 1:]))
+            # Without a usable range the caller parses the file instead
+            if functions:
+                indexed[internal_path] = functions
+        return indexed
+    finally:
+        conn.close()
+
+
 
 
 def _parse_functions_and_classes_from_file(file_path):
@@ -76,22 +138,39 @@ def _parse_functions_and_classes_from_file(file_path):
 
 def _find_changed_functions(changed_files, repo_path):
     result = []
-    for file_path, lines in changed_files.items():
-        try:
-            functions = _parse_functions_and_classes_from_file(file_path)
-            for full_name, (start_line, end_line) in functions.items():
-                if any(start_line <= line <= end_line for line in lines):
-                    internal_path = os.path.relpath(file_path, start=repo_path)
-                    if not internal_path.startswith(os.sep):
-                        internal_path = os.sep+internal_path
-                    result.append(f"{internal_path}:{full_name}")
-        except FileNotFoundError:
-            print(f"File not found: {file_path}")
+    internal_paths = {}
+    for file_path in changed_files:
+        internal_path = os.path.relpath(file_path, start=repo_path)
+        if not internal_path.startswith(os.sep):
+            internal_path = os.sep+internal_path
+        internal_paths[file_path] = internal_path
+    # Files the index covers reuse its line ranges, anything else is parsed here
+    indexed_functions = _load_indexed_functions(repo_path, set(internal_paths.values()))
+    for file_path, ranges in changed_files.items():
+        internal_path = internal_paths[file_path]
+        functions = indexed_functions.get(internal_path)
+        if functions is None:
+            try:
+                functions = [(start_line, end_line, full_name) for full_name, (start_line, end_line) in _parse_functions_and_classes_from_file(file_path).items()]
+            except FileNotFoundError:
+                print(f"File not found: {file_path}")
+                continue
+        for full_name in _overlapping_functions(sorted(functions), _merge_ranges(ranges)):
+            result.append(f"{internal_path}:{full_name}")
     return result
 
 
 
-def get_updated_function_list(base_branch, head_branch, repo, repo_path, pull_request):
-    diff_detail = _get_git_diff_detail(base_branch, head_branch, repo, pull_request)
+def fetch_diff_detail(base_branch, head_branch, repo, pull_request):
+    # Only talks to GitHub, so it can run while the index is still being built
+    return _get_git_diff_detail(base_branch, head_branch, repo, pull_request)
+
+
+def get_changed_functions(diff_detail, repo_path):
     changed_files = _parse_diff_detail(diff_detail, repo_path)
     return _find_changed_functions(changed_files, repo_path)
+
+
+def get_updated_function_list(base_branch, head_branch, repo, repo_path, pull_request):
+    diff_detail = fetch_diff_detail(base_branch, head_branch, repo, pull_request)
+    return get_changed_functions(diff_detail, repo_path)
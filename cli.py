@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+from parse import analyze_directory
+from ingestion import stream_tarball_sources
+from index_cache import IndexCache
+from change_detection import get_changed_functions
+from blast_radius_detection import get_bounded_paths_from_identifiers, parse_blast_radius
+
+
+def git(repo_path, *args):
+    return subprocess.run(["git", "-C", repo_path, *args], check=True, capture_output=True).stdout
+
+
+def resolve_commit(repo_path, ref):
+    try:
+        return git(repo_path, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}").decode().strip()
+    except subprocess.CalledProcessError:
+        raise ValueError(f"{ref} is not a commit in {repo_path}") from None
+
+
+def index_commit(entry_dir, repo_path, commit_sha, workers=None, edge_weights=False, impact_table=False):
+    # Same layout as a downloaded tarball: git archive writes the commit with a top level folder
+    # that stream_tarball_sources strips, so nothing but the .py files is written to disk
+    repo_folder_path = os.path.join(entry_dir, os.path.basename(os.path.abspath(repo_path)))
+    os.makedirs(os.path.join(repo_folder_path, ".momentum"), exist_ok=True)
+    archive = subprocess.Popen(["git", "-C", repo_path, "archive", "--format=tar.gz", "--prefix=repo/", commit_sha], stdout=subprocess.PIPE)
+    try:
+        analyze_directory(repo_folder_path, workers=workers, sources=stream_tarball_sources(archive.stdout, repo_folder_path), edge_weights=edge_weights, impact_table=impact_table)
+    finally:
+        archive.stdout.close()
+        returncode = archive.wait()
+    # Only reached when indexing succeeded; after a failure git archive usually dies of SIGPIPE,
+    # and that error would hide the real one
+    if returncode != 0:
+        raise RuntimeError(f"git archive {commit_sha} failed")
+    return repo_folder_path
+
+
+def blast_radius(repo_path, base_ref, head_ref, cache_dir, workers=None, max_nodes=None, max_depth=None, timeout=None):
+    timings = {}
+    base_sha = resolve_commit(repo_path, base_ref)
+    head_sha = resolve_commit(repo_path, head_ref)
+    # Indexes are cached per checkout and base commit, so repeated runs against one base skip indexing
+    repository_id = hashlib.sha1(os.path.abspath(repo_path).encode()).hexdigest()[:16]
+    index_cache = IndexCache(cache_dir)
+
+    start = time.perf_counter()
+    build = lambda entry_dir: index_commit(entry_dir, repo_path, base_sha, workers)
+    with index_cache.checkout(repository_id, base_sha, build) as repo_dir:
+        timings["index"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # Same diff a pull request from head into base shows: changes since the merge base
+        diff_detail = git(repo_path, "diff", "--no-color", "--no-ext-diff", f"{base_sha}...{head_sha}").decode("utf8", errors="replace")
+        identifiers = get_changed_functions(diff_detail, repo_dir)
+        timings["diff"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        paths, partial = get_bounded_paths_from_identifiers(identifiers, repo_dir, max_nodes=max_nodes, max_depth=max_depth, timeout=timeout)
+        timings["query"] = time.perf_counter() - start
+    return {
+        "base": base_sha,
+        "head": head_sha,
+        "changed_functions": sorted(identifiers),
+        "blast_radius": paths,
+        "partial": partial,
+        "timings": timings,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Blast radius of the changes between two refs of a local git checkout.")
+    parser.add_argument("repo_path", help="path to the git checkout")
+    parser.add_argument("base", help="base ref, e.g. main")
+    parser.add_argument("head", nargs="?", default="HEAD", help="head ref (default: HEAD)")
+    parser.add_argument("--format", choices=("markdown", "json"), default="markdown")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "momentum-index-cache"))
+    parser.add_argument("--workers", type=int, default=0, help="processes used to parse files while indexing")
+    parser.add_argument("--max-nodes", type=int)
+    parser.add_argument("--max-depth", type=int)
+    parser.add_argument("--timeout", type=float, help="seconds the traversal may take")
+    args = parser.parse_args(argv)
+    # An unknown ref is a usage error, reported before any indexing starts
+    try:
+        base, head = resolve_commit(args.repo_path, args.base), resolve_commit(args.repo_path, args.head)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Indexing progress goes to stderr so stdout only carries the result
+    with redirect_stdout(sys.stderr):
+        result = blast_radius(args.repo_path, base, head, args.cache_dir, args.workers, args.max_nodes, args.max_depth, args.timeout)
+        print(" ".join(f"{stage} {seconds:.2f}s" for stage, seconds in result["timings"].items()))
+    if args.format == "json":
+        print(json.dumps(result, indent=2))
+    else:
+        print(parse_blast_radius(result["blast_radius"], result["partial"]), end="")
+
+
+if __name__ == "__main__":
+    main()
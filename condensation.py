@@ -0,0 +1,64 @@
+def strongly_connected_components(nodes, successors):
+    # Iterative Tarjan, so deep call chains cannot hit the recursion limit. Components come
+    # out in reverse topological order: every component is emitted after all it can reach.
+    index_of = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    next_index = 0
+    for root in nodes:
+        if root in index_of:
+            continue
+        index_of[root] = lowlink[root] = next_index
+        next_index += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors.get(root, ())))]
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index_of:
+                    index_of[child] = lowlink[child] = next_index
+                    next_index += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors.get(child, ()))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+
+def condense(nodes, edges):
+    # Returns node -> component id and the set of edges between components. Ids follow a
+    # topological order, so every condensed edge goes from a lower to a higher component.
+    successors = {}
+    for source, target in edges:
+        successors.setdefault(source, []).append(target)
+    component_of = {}
+    for component_id, component in enumerate(reversed(strongly_connected_components(nodes, successors))):
+        for member in component:
+            component_of[member] = component_id
+    component_edges = set()
+    for source, target in edges:
+        if component_of[source] != component_of[target]:
+            component_edges.add((component_of[source], component_of[target]))
+    return component_of, component_edges
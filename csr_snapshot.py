@@ -0,0 +1,244 @@
+import os
+import sys
+import mmap
+import bisect
+import heapq
+import struct
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+
+# magic, format version, little endian flag, nodes, components, condensed edges, name bytes
+HEADER = struct.Struct("<4sIIIIII")
+MAGIC = b"MCSR"
+VERSION = 1
+
+
+def snapshot_path(directory):
+    return f"{directory}/.momentum/momentum.csr"
+
+
+def _aligned(data):
+    # Every section starts on a 4 byte boundary so it can be viewed as uint32 in place
+    return data + b"\0" * (-len(data) % 4)
+
+
+def write_snapshot(directory):
+    # Integer id view of the condensed call graph, written next to momentum.db. Nodes are sorted
+    # by the UTF-8 bytes of their identifier, components keep their topological ids from scc.
+    conn = sqlite3.connect(f"{directory}/.momentum/momentum.db")
+    try:
+        rows = conn.execute("SELECT scc.id, scc.component, node_degrees.is_root FROM scc JOIN node_degrees ON node_degrees.id = scc.id").fetchall()
+        component_edges = conn.execute("SELECT source, target FROM scc_edges").fetchall()
+    finally:
+        conn.close()
+
+    rows.sort(key=lambda row: row[0].encode("utf8"))
+    component_count = max((component for _, component, _ in rows), default=-1) + 1
+    name_offsets = array("I", [0])
+    names = bytearray()
+    node_component = array("I")
+    roots = bytearray(component_count)
+    members = [[] for _ in range(component_count)]
+    for node_index, (identifier, component, is_root) in enumerate(rows):
+        names += identifier.encode("utf8")
+        name_offsets.append(len(names))
+        node_component.append(component)
+        members[component].append(node_index)
+        if is_root:
+            roots[component] = 1
+
+    callers = [[] for _ in range(component_count)]
+    for source, target in component_edges:
+        callers[target].append(source)
+    in_offsets, in_sources = _csr(callers)
+    member_offsets, member_nodes = _csr(members)
+
+    header = HEADER.pack(MAGIC, VERSION, sys.byteorder == "little", len(rows), component_count, len(in_sources), len(names))
+    path = snapshot_path(directory)
+    with open(path + ".tmp", "wb") as snapshot_file:
+        for section in (header, name_offsets.tobytes(), bytes(names), node_component.tobytes(), in_offsets.tobytes(),
+                        in_sources.tobytes(), bytes(roots), member_offsets.tobytes(), member_nodes.tobytes()):
+            snapshot_file.write(_aligned(section))
+    # Readers keep mapping the previous file until they reopen, so replace it atomically
+    os.replace(path + ".tmp", path)
+
+
+def _csr(adjacency):
+    offsets = array("I", [0])
+    targets = array("I")
+    for neighbours in adjacency:
+        targets.extend(sorted(neighbours))
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+class _SortedNames:
+    # Sequence view over the names section for bisect, without decoding every identifier
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return self.snapshot.node_count
+
+    def __getitem__(self, node_index):
+        return self.snapshot.name_bytes(node_index)
+
+
+class GraphSnapshot:
+    """Read-only memory map of a momentum.csr file. Sections are used in place as uint32
+    views, so opening costs no parsing, and worker processes share the same pages."""
+
+    def __init__(self, path):
+        with open(path, "rb") as snapshot_file:
+            self.mm = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little_endian, self.node_count, self.component_count, edge_count, name_length = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION or bool(little_endian) != (sys.byteorder == "little"):
+            raise ValueError(f"Unsupported graph snapshot {path}")
+        view = memoryview(self.mm)
+        position = HEADER.size
+
+        def section(length, item_size=4):
+            nonlocal position
+            data = view[position:position + length * item_size]
+            position += length * item_size + (-(length * item_size) % 4)
+            data = data.cast("I") if item_size == 4 else data
+            self.views.append(data)
+            return data
+
+        self.views = [view]
+        # Callers inside open_snapshot, and whether the snapshot was evicted from the cache
+        self.users = 0
+        self.retired = False
+        self.name_offsets = section(self.node_count + 1)
+        self.names = section(name_length, 1)
+        self.node_component = section(self.node_count)
+        self.in_offsets = section(self.component_count + 1)
+        self.in_sources = section(edge_count)
+        self.roots = section(self.component_count, 1)
+        self.member_offsets = section(self.component_count + 1)
+        self.members = section(self.node_count)
+
+    def close(self):
+        # Every view has to be released before the map can be closed
+        for view in reversed(self.views):
+            view.release()
+        self.mm.close()
+
+    def name_bytes(self, node_index):
+        return self.names[self.name_offsets[node_index]:self.name_offsets[node_index + 1]].tobytes()
+
+    def node_index(self, identifier):
+        key = identifier.encode("utf8")
+        node_index = bisect.bisect_left(_SortedNames(self), key)
+        if node_index < self.node_count and self.name_bytes(node_index) == key:
+            return node_index
+        return None
+
+    def components_of(self, identifiers):
+        # Components of the identifiers that are nodes
+        return {self.node_component[node_index] for node_index in self.node_indexes(set(identifiers)).values()}
+
+    def component_callers(self, component):
+        return self.in_sources[self.in_offsets[component]:self.in_offsets[component + 1]]
+
+    def root_members(self, components):
+        # Identifiers of every member of the given components that are roots
+        members = set()
+        for component in components:
+            if self.roots[component]:
+                for position in range(self.member_offsets[component], self.member_offsets[component + 1]):
+                    members.add(self.name_bytes(self.members[position]).decode("utf8"))
+        return members
+
+    def find_entry_points_batch(self, change_sets):
+        # change_sets maps a label to identifiers. Each label is one bit, and all labels travel
+        # up the condensed DAG together. Callers always have lower component ids than their
+        # callees, so popping components from the highest id down completes a component's
+        # labels before it passes them on, and every component is expanded once.
+        labels = list(change_sets)
+        node_indexes = self.node_indexes(set().union(*change_sets.values()))
+        component_bits = {}
+        for label_index, label in enumerate(labels):
+            for identifier in change_sets[label]:
+                if identifier in node_indexes:
+                    component = self.node_component[node_indexes[identifier]]
+                    component_bits[component] = component_bits.get(component, 0) | (1 << label_index)
+        heap = [-component for component in component_bits]
+        heapq.heapify(heap)
+        while heap:
+            component = -heapq.heappop(heap)
+            bits = component_bits[component]
+            for position in range(self.in_offsets[component], self.in_offsets[component + 1]):
+                caller = self.in_sources[position]
+                if caller not in component_bits:
+                    component_bits[caller] = 0
+                    heapq.heappush(heap, -caller)
+                component_bits[caller] |= bits
+        entry_points = {label: set() for label in labels}
+        for component, bits in component_bits.items():
+            if not self.roots[component]:
+                continue
+            members = [self.name_bytes(self.members[position]).decode("utf8") for position in range(self.member_offsets[component], self.member_offsets[component + 1])]
+            for label_index in set_bits(bits):
+                entry_points[labels[label_index]].update(members)
+        return entry_points
+
+    def node_indexes(self, identifiers):
+        # identifier -> node index for those that are nodes. Large batches decode the name
+        # section once instead of running a binary search per identifier.
+        if len(identifiers) * 16 < self.node_count:
+            found = {identifier: self.node_index(identifier) for identifier in identifiers}
+            return {identifier: node_index for identifier, node_index in found.items() if node_index is not None}
+        names = self.names.tobytes()
+        all_indexes = {names[self.name_offsets[node_index]:self.name_offsets[node_index + 1]].decode("utf8"): node_index for node_index in range(self.node_count)}
+        return {identifier: all_indexes[identifier] for identifier in identifiers if identifier in all_indexes}
+
+
+def set_bits(bits):
+    return [position for position, bit in enumerate(reversed(bin(bits)[2:])) if bit == "1"]
+
+
+_open_snapshots = {}
+_open_snapshots_lock = threading.Lock()
+
+
+@contextmanager
+def open_snapshot(directory, max_open=8):
+    # Mapped once per process and reused until analyze_directory replaces the file. Only the
+    # max_open most recently used snapshots stay mapped; an evicted or replaced snapshot is
+    # closed once the last caller still using it is done.
+    path = snapshot_path(directory)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        yield None
+        return
+    key = (stat.st_ino, stat.st_mtime_ns)
+    with _open_snapshots_lock:
+        cached = _open_snapshots.pop(path, None)
+        if cached is not None and cached[0] != key:
+            _retire(cached[1])
+            cached = None
+        if cached is None:
+            cached = (key, GraphSnapshot(path))
+        _open_snapshots[path] = cached
+        while len(_open_snapshots) > max_open:
+            _retire(_open_snapshots.pop(next(iter(_open_snapshots)))[1])
+        snapshot = cached[1]
+        snapshot.users += 1
+    try:
+        yield snapshot
+    finally:
+        with _open_snapshots_lock:
+            snapshot.users -= 1
+            if snapshot.retired and snapshot.users == 0:
+                snapshot.close()
+
+
+def _retire(snapshot):
+    # Called with _open_snapshots_lock held
+    snapshot.retired = True
+    if snapshot.users == 0:
+        snapshot.close()
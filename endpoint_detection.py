@@ -6,8 +6,10 @@ from simple_graph_sqlite import database as graph
 from tree_sitter import Language, Parser
 import subprocess 
 from tree_sitter_languages import get_parser, get_language
-from pathlib import Path
 import re
+from ingestion import ingest_directory
+from graph_writer import GraphWriter
+from module_index import ModuleIndex, split_import_module
 
 # subprocess.run(["python", "./build/build.py"])
 
@@ -22,11 +24,15 @@ codebase_map = f'./.momentum/momentum.db'
 
 class EndpointManager: 
     
-    def __init__(self, directory: Optional[str] = os.getcwd(), file_index: Optional[dict] = {}, router_prefix_file_mapping: Optional[dict] = {}):
+    def __init__(self, directory: Optional[str] = os.getcwd(), file_index: Optional[dict] = {}, router_prefix_file_mapping: Optional[dict] = {}, parsed_files: Optional[dict] = None, writer: Optional[GraphWriter] = None, module_index: Optional[ModuleIndex] = None):
         self.directory = directory
         self.db_path= f'{directory}/.momentum/momentum.db'
         self.router_prefix_file_mapping = router_prefix_file_mapping
         self.file_index = file_index
+        self.parsed_files = parsed_files
+        self.writer = writer
+        self.module_index = module_index
+        self.resolution_cache = {}
 
     # SQLite database setup
     def setup_database(self):
@@ -59,187 +65,195 @@ class EndpointManager:
             path = '/'
         return path
 
-    def identify_django_endpoints(self, project_path):
-        parser = get_parser("python")
+    def extract_url_patterns(self, content, root_node):
+        url_patterns = []
+
+        # Initialize urlpatterns list
+        urlpatterns_list = []
+
+        # Find the assignment node for the urlpatterns variable
+        for node in root_node.children:
+            if node.type == "expression_statement" and 'urlpatterns' in content[node.start_byte:node.end_byte]:
+                expression = node.children[0]
+                if expression.type == "assignment":
+                    urlpatterns_node = expression.children[2]
+                    if urlpatterns_node.type == "list":
+                        urlpatterns_list.extend(urlpatterns_node.children)
+                elif expression.type == "augmented_assignment" and 'extend' in content[expression.start_byte:expression.end_byte]:
+                    # Handle the case where urlpatterns is extended
+                    extended_list = expression.children[2]
+                    if extended_list.type == "list":
+                        urlpatterns_list.extend(extended_list.children)
+                elif (
+                    expression.type == "call"
+                    and "extend"
+                    in content[expression.start_byte : expression.end_byte]
+                ):
+                    # Handle the case where urlpatterns is extended
+                    extended_list = expression.children[1].children[1]
+                    if extended_list.type == "list":
+                        urlpatterns_list.extend(extended_list.children)
+
+        # Process each URL pattern in urlpatterns_list
+        for url_pattern_node in urlpatterns_list:
+            if url_pattern_node.type == "call":
+                url_pattern = None
+                view_name = None
+                endpoint_name = None
+
+                # Find the argument list node
+                argument_list_node = None
+                for child_node in url_pattern_node.children:
+                    if child_node.type == "argument_list":
+                        argument_list_node = child_node
+                        break
+
+                if argument_list_node:
+                    # Iterate over the arguments in the argument list
+                    for argument_node in argument_list_node.children:
+                        if argument_node.type == "string":
+                            url_pattern = argument_node.text.decode("utf8").strip("'\"")
+                            if url_pattern == "":
+                                url_pattern = "/"
+                        elif argument_node.type == "call":
+                            # Find the identifier node inside the call
+                            identifier_node = None
+                            for child_node in argument_node.children:
+                                if child_node.type == "attribute":
+                                    identifier_node = child_node
+                                    break
+
+                            if identifier_node:
+                                view_name = identifier_node.text.decode("utf8")
+                        elif argument_node.type == "identifier":
+                            # This handles function-based views directly referred by name
+                            view_name = argument_node.text.decode("utf8")
+                        elif argument_node.type == "attribute":
+                            # This handles function-based views directly referred by name
+                            view_name = argument_node.text.decode("utf8")
+
+                if url_pattern and view_name:
+                    url_patterns.append((url_pattern, view_name))
+
+        return url_patterns
 
+    def identify_django_endpoints(self, project_path):
         endpoints = []
 
         # Find all urls.py files in the project
-        urls_files = list(Path(project_path).rglob("urls.py"))
+        urls_files = [
+            file_path
+            for file_path in self.get_parsed_files()
+            if os.path.basename(file_path) == "urls.py" and file_path.startswith(project_path)
+        ]
 
         for urls_file in urls_files:
-            # Read the content of the urls.py file
-            with open(urls_file, "r") as file:
-                content = file.read()
-
-            # Parse the urls.py file using tree-sitter
-            tree = parser.parse(bytes(content, "utf8"))
-            root_node = tree.root_node
-
-            # Initialize urlpatterns list
-            urlpatterns_list = []
-
-            # Find the assignment node for the urlpatterns variable
-            for node in root_node.children:
-                if node.type == "expression_statement" and 'urlpatterns' in content[node.start_byte:node.end_byte]:
-                    expression = node.children[0]
-                    if expression.type == "assignment":
-                        urlpatterns_node = expression.children[2]
-                        if urlpatterns_node.type == "list":
-                            urlpatterns_list.extend(urlpatterns_node.children)
-                    elif expression.type == "augmented_assignment" and 'extend' in content[expression.start_byte:expression.end_byte]:
-                        # Handle the case where urlpatterns is extended
-                        extended_list = expression.children[2]
-                        if extended_list.type == "list":
-                            urlpatterns_list.extend(extended_list.children)
-                    elif (
-                        expression.type == "call"
-                        and "extend"
-                        in content[expression.start_byte : expression.end_byte]
-                    ):
-                        # Handle the case where urlpatterns is extended
-                        extended_list = expression.children[1].children[1]
-                        if extended_list.type == "list":
-                            urlpatterns_list.extend(extended_list.children)
-
-            # Process each URL pattern in urlpatterns_list
-            for url_pattern_node in urlpatterns_list:
-                if url_pattern_node.type == "call":
-                    url_pattern = None
-                    view_name = None
-                    endpoint_name = None
-
-                    # Find the argument list node
-                    argument_list_node = None
-                    for child_node in url_pattern_node.children:
-                        if child_node.type == "argument_list":
-                            argument_list_node = child_node
-                            break
-
-                    if argument_list_node:
-                        # Iterate over the arguments in the argument list
-                        for argument_node in argument_list_node.children:
-                            if argument_node.type == "string":
-                                url_pattern = argument_node.text.decode("utf8").strip("'\"")
-                                if url_pattern == "":
-                                    url_pattern = "/"
-                            elif argument_node.type == "call":
-                                # Find the identifier node inside the call
-                                identifier_node = None
-                                for child_node in argument_node.children:
-                                    if child_node.type == "attribute":
-                                        identifier_node = child_node
-                                        break
-
-                                if identifier_node:
-                                    view_name = identifier_node.text.decode("utf8")
-                            elif argument_node.type == "identifier":
-                                # This handles function-based views directly referred by name
-                                view_name = argument_node.text.decode("utf8")
-                            elif argument_node.type == "attribute":
-                                # This handles function-based views directly referred by name
-                                view_name = argument_node.text.decode("utf8")
-
-                    if url_pattern and view_name:
-                        # Determine the view type (function or class-based)
-                        view = view_name if not view_name.endswith("as_view") else view_name.rsplit(".", 1)[0]
-                        file_path, identifier = self.resolve_called_view_name(view, str(urls_file), self.file_index, self.directory)
-                        if identifier:
-                            entry_point = file_path.replace(self.directory, "") + ":" + identifier
-                            # Append the endpoint information to the list
-                            endpoints.append(("HTTP " + url_pattern, entry_point))
-                            node = self.get_node(entry_point)
-                            if node:
-                                generic_django_views = [
-                                    "RedirectView",
-                                    "TemplateView",
-                                    "View",
-                                    "ArchiveIndexView",
-                                    "DateDetailView",
-                                    "DayArchiveView",
-                                    "MonthArchiveView",
-                                    "TodayArchiveView",
-                                    "WeekArchiveView",
-                                    "YearArchiveView",
-                                    "DetailView",
-                                    "CreateView",
-                                    "DeleteView",
-                                    "FormView",
-                                    "UpdateView",
-                                    "RedirectView",
-                                    "ListView"
-                                ]
-                                for view in generic_django_views:
-                                    if view in node["code"]:
-                                        model_match = re.search(
-                                            r"model\s*=\s*(\w+)", node["code"]
-                                        )
-                                        if model_match:
-                                            model_value = model_match.group(1)
-                                            model_file, model_name = (
-                                                self.resolve_called_view_name(
-                                                    model_value,
-                                                    file_path,
-                                                    self.file_index,
-                                                    self.directory,
+            # Reuse the url patterns extracted by the ingestion stage
+            for url_pattern, view_name in self.parsed_files[urls_file]["url_patterns"]:
+                # Determine the view type (function or class-based)
+                view = view_name if not view_name.endswith("as_view") else view_name.rsplit(".", 1)[0]
+                file_path, identifier = self.resolve_called_view_name(view, urls_file, self.file_index, self.directory)
+                if identifier:
+                    entry_point = file_path.replace(self.directory, "") + ":" + identifier
+                    # Append the endpoint information to the list
+                    endpoints.append(("HTTP " + url_pattern, entry_point))
+                    node = self.get_node(entry_point)
+                    if node:
+                        generic_django_views = [
+                            "RedirectView",
+                            "TemplateView",
+                            "View",
+                            "ArchiveIndexView",
+                            "DateDetailView",
+                            "DayArchiveView",
+                            "MonthArchiveView",
+                            "TodayArchiveView",
+                            "WeekArchiveView",
+                            "YearArchiveView",
+                            "DetailView",
+                            "CreateView",
+                            "DeleteView",
+                            "FormView",
+                            "UpdateView",
+                            "RedirectView",
+                            "ListView"
+                        ]
+                        for view in generic_django_views:
+                            if view in node["code"]:
+                                model_match = re.search(
+                                    r"model\s*=\s*(\w+)", node["code"]
+                                )
+                                if model_match:
+                                    model_value = model_match.group(1)
+                                    model_file, model_name = (
+                                        self.resolve_called_view_name(
+                                            model_value,
+                                            file_path,
+                                            self.file_index,
+                                            self.directory,
                                                 
-                                                )
+                                        )
+                                    )
+                                    if model_name:
+                                        model_identifier = (
+                                            model_file.replace(
+                                                self.directory, ""
                                             )
-                                            if model_name:
-                                                model_identifier = (
-                                                    model_file.replace(
-                                                        self.directory, ""
-                                                    )
-                                                    + ":"
-                                                    + model_name
-                                                )
-                                                graph.atomic(
-                                                    self.db_path,
-                                                    graph.connect_nodes(
-                                                        entry_point,
-                                                        model_identifier,
-                                                        {"action": "calls"},
-                                                    ),
-                                                )
-                                    
-                                        form_match = re.search(
-                                            r"form_class\s*=\s*(\w+)", node["code"]
+                                            + ":"
+                                            + model_name
+                                        )
+                                        self.writer.connect_nodes(
+                                            entry_point,
+                                            model_identifier,
+                                            {"action": "calls"},
                                         )
-                                        if form_match:
-                                            form_value = form_match.group(1)
-                                            form_file, form_name = (
-                                                self.resolve_called_view_name(
-                                                    form_value,
-                                                    file_path,
-                                                    self.file_index,
-                                                    self.directory,
+                                    
+                                form_match = re.search(
+                                    r"form_class\s*=\s*(\w+)", node["code"]
+                                )
+                                if form_match:
+                                    form_value = form_match.group(1)
+                                    form_file, form_name = (
+                                        self.resolve_called_view_name(
+                                            form_value,
+                                            file_path,
+                                            self.file_index,
+                                            self.directory,
                                                     
-                                                )
+                                        )
+                                    )
+                                    if form_name:
+                                        form_identifier = (
+                                            form_file.replace(
+                                                self.directory, ""
                                             )
-                                            if form_name:
-                                                form_identifier = (
-                                                    form_file.replace(
-                                                        self.directory, ""
-                                                    )
-                                                    + ":"
-                                                    + form_name
-                                                )
-                                                graph.atomic(
-                                                    self.db_path,
-                                                    graph.connect_nodes(
-                                                        entry_point,
-                                                        form_identifier,
-                                                        {"action": "calls"},
-                                                    ),
-                                                )
+                                            + ":"
+                                            + form_name
+                                        )
+                                        self.writer.connect_nodes(
+                                            entry_point,
+                                            form_identifier,
+                                            {"action": "calls"},
+                                        )
 
         return endpoints
     # Function to parse a Python file and return FastAPI endpoint functions with additional details
-    def find_endpoints_from_decorator(self, source_code, filename):
-        parser = get_parser("python")
-        tree = parser.parse(bytes(source_code, "utf8"))
+    def find_endpoints_from_decorator(self, source_code, filename, tree=None):
+        if tree is None:
+            tree = parser.parse(bytes(source_code, "utf8"))
+        endpoints, responses = self.extract_decorator_endpoints(source_code, filename, tree)
+        self.apply_endpoint_responses(responses)
+        return endpoints
+
+    def apply_endpoint_responses(self, responses):
+        for function_identifier, response in responses:
+            obj = self.get_node(function_identifier)
+            obj["response"] = response
+            self.update_node(function_identifier, obj)
 
+    def extract_decorator_endpoints(self, source_code, filename, tree):
         endpoints = []
+        responses = []
         def visit_node(node):
             if node.type == "decorated_definition":
                 for child in node.children:
@@ -316,12 +330,8 @@ class EndpointManager:
                                                         response = kid.children[
                                                             2
                                                         ].text.decode("utf8")
-                                                        obj = self.get_node(
-                                                            function_identifier
-                                                        )
-                                                        obj["response"] = response
-                                                        self.update_node(
-                                                            function_identifier, obj
+                                                        responses.append(
+                                                            (function_identifier, response)
                                                         )
                             for entrypoint in endpoint_list:
                                 endpoints.append((entrypoint, function_identifier))
@@ -330,8 +340,29 @@ class EndpointManager:
                 visit_node(child)
 
         visit_node(tree.root_node)
-        return [(decorator, func_name) for decorator, func_name in endpoints]
-
+        return [(decorator, func_name) for decorator, func_name in endpoints], responses
+
+    def extract_endpoint_record(self, file_path, source_code, tree):
+        # Plain data for one file so endpoint detection can run without the tree, e.g. from a worker process
+        decorator_endpoints, endpoint_responses = self.extract_decorator_endpoints(source_code, file_path, tree)
+        url_patterns = []
+        if os.path.basename(file_path) == "urls.py":
+            url_patterns = self.extract_url_patterns(source_code, tree.root_node)
+        return {
+            "decorator_endpoints": decorator_endpoints,
+            "endpoint_responses": endpoint_responses,
+            "url_patterns": url_patterns,
+        }
+
+
+    def get_parsed_files(self):
+        # Standalone use without shared file records falls back to parsing the directory here
+        if self.parsed_files is None:
+            self.parsed_files = ingest_directory(self.directory)
+        for file_path, parsed_file in self.parsed_files.items():
+            if "decorator_endpoints" not in parsed_file:
+                parsed_file.update(self.extract_endpoint_record(file_path, parsed_file["source_code"], parsed_file["tree"]))
+        return self.parsed_files
 
     def get_python_filepaths(self, directory_path):
         python_filepaths = []
@@ -367,34 +398,31 @@ class EndpointManager:
     
     def analyse_endpoints(self):
         self.setup_database()
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        cursor = conn.cursor()
+        # Without a writer shared by the index run, buffer this pass on its own and flush at the end
+        owns_writer = self.writer is None
+        if owns_writer:
+            self.writer = GraphWriter(self.db_path)
         detected_endpoints = []
         detected_endpoints = self.identify_django_endpoints(self.directory)
 
-        file_paths = self.get_python_filepaths(self.directory)
-        for file_path in file_paths:
-            with open(file_path, "r", encoding="utf-8") as file:
-                source_code = file.read()
-                decorator_endpoints = self.find_endpoints_from_decorator(
-                    source_code, file_path
-                )
-                if decorator_endpoints:
-                    detected_endpoints.extend(decorator_endpoints)
+        for file_path, parsed_file in self.get_parsed_files().items():
+            self.apply_endpoint_responses(parsed_file["endpoint_responses"])
+            decorator_endpoints = parsed_file["decorator_endpoints"]
+            if decorator_endpoints:
+                detected_endpoints.extend(decorator_endpoints)
         for path, identifier in detected_endpoints:
             router_info = self.router_prefix_file_mapping.get(identifier.split(":")[0], {})
             prefix = router_info.get("prefix", None)
             depends = router_info.get("depends", [])
             path = self.get_qualified_endpoint_name(path, prefix)
-            try:
-                cursor.execute("INSERT INTO endpoints (path, identifier) VALUES (?, ?)", (path, identifier))
-                conn.commit()
-            except sqlite3.IntegrityError:
-                print(f"Duplicate entry for identifier {identifier} skipped.")
+            self.writer.add_endpoint(path, identifier)
             for dependency in depends:
-                graph.atomic(self.db_path, graph.connect_nodes(identifier, dependency, {'action': 'calls'}))
-        
-        conn.close()
+                self.writer.connect_nodes(identifier, dependency, {'action': 'calls'})
+
+        if owns_writer:
+            self.writer.flush()
+            self.writer.close()
+            self.writer = None
 
     def get_qualified_endpoint_name(self, path, prefix):
         if prefix == None:
@@ -514,25 +542,29 @@ class EndpointManager:
         return test_plan, preferences
             
     def get_node(self, function_identifier):
+        if self.writer:
+            return self.writer.get_node(function_identifier)
         codebase_map = f'{self.directory}/.momentum/momentum.db'
         return graph.atomic(codebase_map, graph.find_node(function_identifier))
 
     def update_node(self, function_identifier, body):
+        if self.writer:
+            return self.writer.upsert_node(function_identifier, body)
         codebase_map = f'{self.directory}/.momentum/momentum.db'
         return graph.atomic(codebase_map, graph.upsert_node(function_identifier, body))
     
-    def find_py_files_with_substring(self, dir_path, substring):
-        for root, dirs, files in os.walk(dir_path):
-            for file in files:
-                path = os.path.join(root, file)
-                if (
-                    substring in path
-                    and file.endswith(".py")
-                    and not file.startswith("test")
-                ):
-                    yield os.path.join(root, file)
-                    
+    def get_module_index(self):
+        if self.module_index is None:
+            self.module_index = ModuleIndex(self.file_index)
+        return self.module_index
+
     def resolve_called_view_name(self, name, file_path, file_index, directory):
+        key = (file_path, name)
+        if key not in self.resolution_cache:
+            self.resolution_cache[key] = self._resolve_called_view_name(name, file_path, file_index, directory)
+        return self.resolution_cache[key]
+
+    def _resolve_called_view_name(self, name, file_path, file_index, directory):
         # handle DEPENDS later
         if len(name.split(".")) >= 2:
             base = name.split(".")[0]
@@ -543,116 +575,28 @@ class EndpointManager:
             base = name
         else:
             return file_path, None
-        if base in file_index[file_path]["class_instances"].keys():
+        symbols = file_index[file_path]["symbols"]
+        if base in file_index[file_path]["class_instances"]:
             class_context = file_index[file_path]["class_instances"][base]
-            if class_context in file_index[file_path]["class_definition"]:
+            if class_context in symbols["classes"]:
                 return file_path, class_context
-            module_value = None
-            for import_entry in file_index[file_path]["imports"]:
-                if import_entry.get("alias") == class_context:
-                    module_value = import_entry.get("module")
-                    break
-                elif class_context in import_entry.get("module"):
-                    module_value = import_entry.get("module")
-                    break
+            module_value = symbols["imports"].get(class_context)
             if module_value:
-                if module_value.startswith("."):
-                    num_up_dirs = len(module_value) - len(
-                        module_value.lstrip(".")
-                    )  # Count the number of leading dots to determine relative depth
-                    file_path_parts = file_path.split("/")[:-1]  # Remove the filename
-                    # Use the last num_up_dirs elements from file_path_parts if num_up_dirs is not more than the length of file_path_parts
-                    base_path_parts = (
-                        file_path_parts[-num_up_dirs:]
-                        if num_up_dirs <= len(file_path_parts)
-                        else []
-                    )
-                    module_parts = module_value.lstrip(".").split(
-                        "."
-                    )  # Remove leading dots and split
-                    potential_module = "/".join(
-                        base_path_parts + module_parts[:-1]
-                    )  # Combine the paths
-                else:
-                    module_parts = module_value.split(".")
-                    potential_module = (
-                        "/".join(module_parts[:-1]) if len(module_parts) > 1 else ""
-                    )
-                potential_class_or_instance = module_parts[-1]
-
-                candidate_files = list(
-                    self.find_py_files_with_substring(directory, potential_module)
-                )
-                for candidate_file in candidate_files:
-                    candidate_path = os.path.join(directory, candidate_file)
-                    if candidate_path in file_index:
-                        # Check if it's a class definition
-                        if (
-                            potential_class_or_instance
-                            in file_index[candidate_path]["class_definition"]
-                        ):
-                            return candidate_path, potential_class_or_instance
-                        # Check if it's a class instance
-                        elif (
-                            potential_class_or_instance
-                            in file_index[candidate_path]["class_instances"].keys()
-                        ):
-                            return (
-                                candidate_path,
-                                file_index[candidate_path]["class_instances"][
-                                    potential_class_or_instance
-                                ],
-                            )
-            # TODO DEDUP   # If no class or instance match, return with the function appended
-        module_value = None
-        for import_entry in file_index[file_path]["imports"]:
-            if import_entry.get("alias") == base:
-                module_value = import_entry.get("module")
-                break
-            elif base in import_entry.get("module"):
-                module_value = import_entry.get("module")
-                break
-        if module_value:
-            if module_value.startswith("."):
-                num_up_dirs = len(module_value) - len(
-                    module_value.lstrip(".")
-                )  # Count the number of leading dots to determine relative depth
-                file_path_parts = file_path.split("/")[:-1]  # Remove the filename
-                # Use the last num_up_dirs elements from file_path_parts if num_up_dirs is not more than the length of file_path_parts
-                base_path_parts = (
-                    file_path_parts[-num_up_dirs:]
-                    if num_up_dirs <= len(file_path_parts)
-                    else []
-                )
-                module_parts = module_value.lstrip(".").split(
-                    "."
-                )  # Remove leading dots and split
-                potential_module = "/".join(
-                    base_path_parts + module_parts[:-1]
-                )  # Combine the paths
-            else:
-                module_parts = module_value.split(".")
-                potential_module = (
-                    "/".join(module_parts[:-1]) if len(module_parts) > 1 else ""
+                potential_module, potential_class_or_instance = split_import_module(
+                    module_value, file_path
                 )
-            potential_class_or_instance = function
 
-            candidate_files = list(
-                self.find_py_files_with_substring(directory, potential_module)
-            )
-            for candidate_file in candidate_files:
-                candidate_path = os.path.join(directory, candidate_file)
-                if candidate_path in file_index:
+                for candidate_path in self.get_module_index().candidates(potential_module):
                     # Check if it's a class definition
                     if (
                         potential_class_or_instance
-                        in file_index[candidate_path]["class_definition"]
+                        in file_index[candidate_path]["symbols"]["classes"]
                     ):
                         return candidate_path, potential_class_or_instance
                     # Check if it's a class instance
                     elif (
                         potential_class_or_instance
-                        in file_index[candidate_path]["class_instances"].keys()
+                        in file_index[candidate_path]["class_instances"]
                     ):
                         return (
                             candidate_path,
@@ -660,11 +604,34 @@ class EndpointManager:
                                 potential_class_or_instance
                             ],
                         )
-                    elif potential_class_or_instance in [
-                        key.split(":")[-1]
-                        for key in file_index[candidate_path]["functions"].keys()
-                    ]:
-                        return candidate_path, potential_class_or_instance
+            # TODO DEDUP   # If no class or instance match, return with the function appended
+        module_value = symbols["imports"].get(base)
+        if module_value:
+            potential_module, _ = split_import_module(module_value, file_path)
+            potential_class_or_instance = function
+
+            for candidate_path in self.get_module_index().candidates(potential_module):
+                # Check if it's a class definition
+                if (
+                    potential_class_or_instance
+                    in file_index[candidate_path]["symbols"]["classes"]
+                ):
+                    return candidate_path, potential_class_or_instance
+                # Check if it's a class instance
+                elif (
+                    potential_class_or_instance
+                    in file_index[candidate_path]["class_instances"]
+                ):
+                    return (
+                        candidate_path,
+                        file_index[candidate_path]["class_instances"][
+                            potential_class_or_instance
+                        ],
+                    )
+                elif (
+                    potential_class_or_instance
+                    in file_index[candidate_path]["symbols"]["functions"]
+                ):
+                    return candidate_path, potential_class_or_instance
             # If no class or instance match, return with the function appended
         return file_path, None
-
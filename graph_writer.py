@@ -0,0 +1,222 @@
+import json
+import sqlite3
+from simple_graph_sqlite import database as graph
+from condensation import condense
+
+# Indexes are kept in the on-disk cache and reused across events, so a crash must not leave a
+# corrupt database behind. In WAL mode synchronous = NORMAL keeps the file consistent and only
+# skips the fsync per commit; close() checkpoints the WAL before the entry is marked READY.
+WRITE_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA foreign_keys = TRUE",
+]
+
+INSERT_NODE = graph.read_sql('insert-node.sql')
+UPDATE_NODE = graph.read_sql('update-node.sql')
+INSERT_EDGE = graph.read_sql('insert-edge.sql')
+
+# Degrees count distinct neighbours and ignore self calls, so a root is a node nothing else calls
+REFRESH_NODE_DEGREES = """
+INSERT INTO node_degrees (id, in_degree, out_degree, is_root)
+SELECT nodes.id, COALESCE(inbound.degree, 0), COALESCE(outbound.degree, 0), COALESCE(inbound.degree, 0) = 0
+FROM nodes
+LEFT JOIN (SELECT target, count(DISTINCT source) AS degree FROM edges WHERE source != target GROUP BY target) AS inbound
+    ON inbound.target = nodes.id
+LEFT JOIN (SELECT source, count(DISTINCT target) AS degree FROM edges WHERE source != target GROUP BY source) AS outbound
+    ON outbound.source = nodes.id
+"""
+
+# Within a cycle every member has callers, so roots are decided on the condensed graph:
+# a node is a root when no other component calls into its component
+REFRESH_ROOTS_FROM_COMPONENTS = """
+UPDATE node_degrees SET is_root = NOT EXISTS (
+    SELECT 1 FROM scc JOIN scc_edges ON scc_edges.target = scc.component WHERE scc.id = node_degrees.id
+)
+"""
+
+
+class GraphWriter:
+    """Buffers nodes, edges, pydantic rows and endpoints for one index run and
+    writes them with executemany in a single transaction on flush().
+
+    With replace=True the buffered edges, pydantic rows and endpoints are the complete
+    set for the repository, and flush() brings those tables in line with them, so an
+    incremental run only touches the rows that actually changed.
+
+    Edges are deduplicated in memory, so a call repeated in a loop or the same Depends()
+    used many times is written once. With edge_weights=True the number of call sites is
+    stored as the edge's weight property."""
+
+    def __init__(self, db_path, replace=False, edge_weights=False):
+        self.db_path = db_path
+        self.replace = replace
+        self.edge_weights = edge_weights
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        for pragma in WRITE_PRAGMAS:
+            self.conn.execute(pragma)
+        self.nodes = {}
+        self.edges = {}
+        self.pydantic = {}
+        self.endpoints = {}
+        self.file_records = {}
+        self.removed_files = []
+        # Edge rows inserted by flush(); with replace=True only the ones that changed
+        self.written_edges = 0
+
+    def upsert_node(self, identifier, body):
+        # Same merge semantics as graph.upsert_node, applied to the buffer first
+        if identifier in self.nodes:
+            self.nodes[identifier] = {**self.nodes[identifier], **body}
+        else:
+            self.nodes[identifier] = dict(body)
+
+    def get_node(self, identifier):
+        stored = graph.find_node(identifier)(self.conn.cursor())
+        if identifier in self.nodes:
+            return {**stored, **self.nodes[identifier], "id": identifier}
+        return stored
+
+    def connect_nodes(self, source_id, target_id, properties={}, count=1):
+        # Compact separators match the json() normalisation SQLite applies on insert
+        key = (source_id, target_id, json.dumps(properties, separators=(",", ":"), sort_keys=True))
+        self.edges[key] = self.edges.get(key, 0) + count
+
+    def put_pydantic_class(self, filepath, classname, definition):
+        self.pydantic[(filepath, classname)] = definition
+
+    def get_file_records(self):
+        # filepath -> (content hash, serialized record) from the previous index run
+        return {filepath: (content_hash, record) for filepath, content_hash, record in self.conn.execute("SELECT filepath, hash, record FROM files")}
+
+    def put_file_record(self, filepath, content_hash, record):
+        self.file_records[filepath] = (content_hash, json.dumps(record))
+
+    def remove_file_record(self, filepath):
+        self.removed_files.append(filepath)
+
+    def remove_file_nodes(self, file_identifiers):
+        # Runs inside the pending transaction, so later reads through this writer no longer
+        # see nodes of changed files, and nothing is committed until flush()
+        cursor = self.conn.cursor()
+        for file_identifier in file_identifiers:
+            # Identifiers are "<file>:<name>" and ";" sorts right after ":", so this is a range scan on the id index
+            bounds = (file_identifier + ":", file_identifier + ";")
+            cursor.execute("DELETE FROM edges WHERE source >= ? AND source < ?", bounds)
+            cursor.execute("DELETE FROM edges WHERE target >= ? AND target < ?", bounds)
+            cursor.execute("DELETE FROM nodes WHERE id >= ? AND id < ?", bounds)
+
+    def add_endpoint(self, path, identifier):
+        if identifier in self.endpoints:
+            print(f"Duplicate entry for identifier {identifier} skipped.")
+            return
+        self.endpoints[identifier] = path
+
+    def flush(self):
+        cursor = self.conn.cursor()
+        try:
+            if not self.conn.in_transaction:
+                cursor.execute("BEGIN")
+            known = self._flush_nodes(cursor)
+            self._flush_edges(cursor, known)
+            if self.replace:
+                cursor.execute("DELETE FROM pydantic")
+            cursor.executemany(
+                "INSERT OR REPLACE INTO pydantic (filepath,classname,definition) VALUES (?,?,?)",
+                [(filepath, classname, definition) for (filepath, classname), definition in self.pydantic.items()],
+            )
+            self._flush_endpoints(cursor)
+            has_components = self._flush_condensation(cursor)
+            self._flush_node_degrees(cursor, has_components)
+            cursor.executemany(
+                "INSERT OR REPLACE INTO files (filepath, hash, record) VALUES (?, ?, ?)",
+                [(filepath, content_hash, record) for filepath, (content_hash, record) in self.file_records.items()],
+            )
+            cursor.executemany("DELETE FROM files WHERE filepath = ?", [(filepath,) for filepath in self.removed_files])
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.nodes = {}
+        self.edges = {}
+        self.pydantic = {}
+        self.endpoints = {}
+        self.file_records = {}
+        self.removed_files = []
+
+    def _flush_nodes(self, cursor):
+        # Returns the ids of all nodes in the table once the buffered ones are written
+        known = {row[0] for row in cursor.execute("SELECT id FROM nodes")}
+        inserts = []
+        updates = []
+        for identifier, body in self.nodes.items():
+            if identifier in known:
+                stored = graph.find_node(identifier)(cursor)
+                updates.append((json.dumps({**stored, **body, "id": identifier}), identifier))
+            else:
+                inserts.append((json.dumps({**body, "id": identifier}),))
+        cursor.executemany(INSERT_NODE, inserts)
+        cursor.executemany(UPDATE_NODE, updates)
+        return known.union(self.nodes)
+
+    def _flush_edges(self, cursor, known):
+        # Edges to unknown nodes would fail the foreign key check and abort the whole batch
+        rows = []
+        for (source_id, target_id, properties), count in self.edges.items():
+            if source_id in known and target_id in known:
+                if self.edge_weights:
+                    properties = json.dumps({**json.loads(properties), "weight": count}, separators=(",", ":"), sort_keys=True)
+                rows.append((source_id, target_id, properties))
+            else:
+                print(f"Edge {source_id} -> {target_id} references a missing node. Skipping insert.")
+        if self.replace:
+            existing = set(cursor.execute("SELECT source, target, properties FROM edges"))
+            cursor.executemany("DELETE FROM edges WHERE source = ? AND target = ? AND properties = ?", existing.difference(rows))
+            rows = [row for row in rows if row not in existing]
+        cursor.executemany(INSERT_EDGE, rows)
+        self.written_edges += len(rows)
+
+    def _flush_condensation(self, cursor):
+        # Strongly connected components of the whole graph and the DAG between them
+        if not table_exists(cursor, "scc"):
+            return False
+        nodes = sorted(row[0] for row in cursor.execute("SELECT id FROM nodes"))
+        edges = sorted(set(cursor.execute("SELECT source, target FROM edges")))
+        component_of, component_edges = condense(nodes, edges)
+        cursor.execute("DELETE FROM scc")
+        cursor.execute("DELETE FROM scc_edges")
+        cursor.executemany("INSERT INTO scc (id, component) VALUES (?, ?)", component_of.items())
+        cursor.executemany("INSERT INTO scc_edges (source, target) VALUES (?, ?)", sorted(component_edges))
+        return True
+
+    def _flush_node_degrees(self, cursor, has_components=False):
+        # Recomputed from scratch in one statement; indexes built before the table existed have none
+        if table_exists(cursor, "node_degrees"):
+            cursor.execute("DELETE FROM node_degrees")
+            cursor.execute(REFRESH_NODE_DEGREES)
+            if has_components:
+                cursor.execute(REFRESH_ROOTS_FROM_COMPONENTS)
+
+    def _flush_endpoints(self, cursor):
+        rows = [(path, identifier) for identifier, path in self.endpoints.items()]
+        if not self.replace:
+            cursor.executemany("INSERT OR IGNORE INTO endpoints (path, identifier) VALUES (?, ?)", rows)
+            return
+        # Keep surviving rows in place so their test plans and preferences carry over
+        stale = [(identifier,) for (identifier,) in cursor.execute("SELECT identifier FROM endpoints") if identifier not in self.endpoints]
+        cursor.executemany("DELETE FROM endpoints WHERE identifier = ?", stale)
+        cursor.executemany(
+            "INSERT INTO endpoints (path, identifier) VALUES (?, ?) ON CONFLICT(identifier) DO UPDATE SET path = excluded.path",
+            rows,
+        )
+
+    def close(self):
+        # Fold the WAL back into the main file so the index is a single self-contained database
+        self.conn.execute("PRAGMA journal_mode = DELETE")
+        self.conn.close()
+
+
+def table_exists(cursor, name):
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
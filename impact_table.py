@@ -0,0 +1,69 @@
+import sqlite3
+
+
+def _create_impact_tables(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS impact_endpoints (
+                        endpoint_id INTEGER PRIMARY KEY,
+                        identifier TEXT UNIQUE
+                        )''')
+    # endpoints holds a little endian bitset of endpoint_id values
+    cursor.execute('''CREATE TABLE IF NOT EXISTS impact (
+                        id TEXT PRIMARY KEY,
+                        endpoints BLOB
+                        )''')
+
+
+def drop_impact_table(directory):
+    # A disabled stage must not leave a table behind that no longer matches the graph
+    conn = sqlite3.connect(f"{directory}/.momentum/momentum.db")
+    try:
+        conn.execute("DROP TABLE IF EXISTS impact")
+        conn.execute("DROP TABLE IF EXISTS impact_endpoints")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_impact_table(directory):
+    # Push the id of every root endpoint down the condensed call graph once, so the endpoints a
+    # function affects become a single row lookup instead of a traversal at query time
+    conn = sqlite3.connect(f"{directory}/.momentum/momentum.db")
+    try:
+        cursor = conn.cursor()
+        component_of = dict(cursor.execute("SELECT id, component FROM scc"))
+        component_callees = {}
+        for source, target in cursor.execute("SELECT source, target FROM scc_edges"):
+            component_callees.setdefault(source, []).append(target)
+        root_endpoints = [row[0] for row in cursor.execute(
+            "SELECT identifier FROM endpoints JOIN node_degrees ON node_degrees.id = endpoints.identifier "
+            "WHERE is_root = 1 ORDER BY identifier"
+        )]
+
+        component_bits = {}
+        for endpoint_id, identifier in enumerate(root_endpoints):
+            component = component_of[identifier]
+            component_bits[component] = component_bits.get(component, 0) | (1 << endpoint_id)
+        # Component ids are topologically ordered, so one ascending pass sees every
+        # component after all of its callers
+        for component in sorted(set(component_of.values())):
+            if component not in component_bits:
+                continue
+            for callee in component_callees.get(component, ()):
+                component_bits[callee] = component_bits.get(callee, 0) | component_bits[component]
+
+        width = (len(root_endpoints) + 7) // 8
+        rows = [(identifier, component_bits[component].to_bytes(width, "little")) for identifier, component in component_of.items() if component in component_bits]
+        cursor.execute("BEGIN")
+        _create_impact_tables(cursor)
+        cursor.execute("DELETE FROM impact_endpoints")
+        cursor.execute("DELETE FROM impact")
+        cursor.executemany("INSERT INTO impact_endpoints (endpoint_id, identifier) VALUES (?, ?)", enumerate(root_endpoints))
+        cursor.executemany("INSERT INTO impact (id, endpoints) VALUES (?, ?)", rows)
+        conn.commit()
+        print(f"Impact table built for {len(root_endpoints)} endpoints over {len(rows)} functions.")
+    finally:
+        conn.close()
+
+
+def decode_endpoint_ids(endpoint_bits):
+    return [endpoint_id for endpoint_id, bit in enumerate(reversed(bin(endpoint_bits)[2:])) if bit == "1"]
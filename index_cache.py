@@ -0,0 +1,137 @@
+import os
+import json
+import fcntl
+import shutil
+from contextlib import contextmanager
+from metrics import metrics
+
+
+class IndexCache:
+    """Built indexes on disk, one entry per (repository_id, commit_sha), so repeated
+    events against the same base commit skip the download, extraction and indexing.
+
+    Every key has a lock file outside the entry directory. Readers hold it shared while
+    they use an entry, a missing entry is built under the exclusive lock, and eviction
+    only removes entries whose lock it can take exclusively without waiting. An entry
+    counts as built once its READY marker exists; the marker's mtime is the LRU clock."""
+
+    def __init__(self, root, max_entries=16, max_bytes=2 * 1024 * 1024 * 1024):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(self.root, "locks"), exist_ok=True)
+
+    def entry_path(self, repository_id, commit_sha):
+        return os.path.join(self.root, str(repository_id), commit_sha)
+
+    def lock_path(self, repository_id, commit_sha):
+        return os.path.join(self.root, "locks", f"{repository_id}-{commit_sha}.lock")
+
+    def recent_commits(self, repository_id):
+        # Built commits of a repository, most recently used first
+        repository_root = os.path.join(self.root, str(repository_id))
+        if not os.path.isdir(repository_root):
+            return []
+        built = []
+        for commit_sha in os.listdir(repository_root):
+            marker_path = os.path.join(repository_root, commit_sha, "READY")
+            if os.path.exists(marker_path):
+                built.append((os.path.getmtime(marker_path), commit_sha))
+        return [commit_sha for _, commit_sha in sorted(built, reverse=True)]
+
+    @contextmanager
+    def checkout(self, repository_id, commit_sha, build=None):
+        # Yields the repository directory of the entry. On a miss build(entry_dir) fills the
+        # empty entry directory and returns the repository directory it created inside it;
+        # without a build function a miss yields None.
+        entry = self.entry_path(repository_id, commit_sha)
+        with open(self.lock_path(repository_id, commit_sha), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                repo_dir = self._ready(entry)
+                if repo_dir is None and build is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    # Another worker may have built it while we waited for the exclusive lock
+                    repo_dir = self._ready(entry)
+                    if repo_dir is None:
+                        metrics.increment("index_cache_misses_total")
+                        repo_dir = self._build(entry, build)
+                    else:
+                        metrics.increment("index_cache_hits_total")
+                    fcntl.flock(lock_file, fcntl.LOCK_SH)
+                    self.evict()
+                elif repo_dir is not None:
+                    os.utime(os.path.join(entry, "READY"))
+                    # Lookups without a build function (fast-forward candidates) are not a job's own hit or miss
+                    if build is not None:
+                        metrics.increment("index_cache_hits_total")
+                        print(f"Index cache hit for {repository_id}@{commit_sha}")
+                yield repo_dir
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _ready(self, entry):
+        try:
+            with open(os.path.join(entry, "READY")) as marker:
+                return os.path.join(entry, json.load(marker)["repo_dir"])
+        except FileNotFoundError:
+            return None
+
+    def _build(self, entry, build):
+        # Leftovers of a build that died half way are discarded first
+        shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(entry)
+        try:
+            repo_dir = build(entry)
+            size = directory_size(entry)
+            with open(os.path.join(entry, "READY"), "w") as marker:
+                json.dump({"repo_dir": os.path.relpath(repo_dir, entry), "size": size}, marker)
+        except Exception:
+            shutil.rmtree(entry, ignore_errors=True)
+            raise
+        return repo_dir
+
+    def evict(self):
+        entries = []
+        for repository_id in os.listdir(self.root):
+            if repository_id == "locks":
+                continue
+            for commit_sha in os.listdir(os.path.join(self.root, repository_id)):
+                marker_path = os.path.join(self.root, repository_id, commit_sha, "READY")
+                try:
+                    with open(marker_path) as marker:
+                        size = json.load(marker)["size"]
+                    entries.append((os.path.getmtime(marker_path), size, repository_id, commit_sha))
+                except (FileNotFoundError, ValueError):
+                    continue
+        entries.sort()
+        total_bytes = sum(size for _, size, _, _ in entries)
+        total_entries = len(entries)
+        for _, size, repository_id, commit_sha in entries:
+            if total_entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            with open(self.lock_path(repository_id, commit_sha), "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # In use or being rebuilt, try the next oldest
+                    continue
+                entry = self.entry_path(repository_id, commit_sha)
+                if self._ready(entry) is None:
+                    continue
+                os.remove(os.path.join(entry, "READY"))
+                shutil.rmtree(entry, ignore_errors=True)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            print(f"Evicted cached index {repository_id}@{commit_sha}")
+            total_bytes -= size
+            total_entries -= 1
+
+
+def directory_size(directory):
+    size = 0
+    for subdir, _, files in os.walk(directory):
+        for file in files:
+            file_path = os.path.join(subdir, file)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+    return size
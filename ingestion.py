@@ -0,0 +1,91 @@
+import io
+import os
+import tarfile
+from tree_sitter_languages import get_parser
+
+parser = get_parser("python")
+
+
+def is_indexable_file(file):
+    return file.endswith('.py') and not file.startswith("test")
+
+
+def list_source_files(directory):
+    file_paths = []
+    for subdir, _, files in os.walk(directory):
+        for file in files:
+            if is_indexable_file(file):
+                file_paths.append(os.path.join(subdir, file))
+    return sorted(file_paths, key=source_order)
+
+
+def source_order(file_path):
+    # os.walk order with sorted listings: a directory's files come before its subdirectories.
+    # Raw walk order depends on the filesystem, and call resolution takes the first matching
+    # file, so both the disk and the tarball path merge records in this order.
+    parts = file_path.split('/')
+    return tuple(parts[:-1]), parts[-1]
+
+
+def read_source(file_path):
+    with open(file_path, 'r') as source_file:
+        try:
+            return source_file.read()
+        except Exception as e:
+            print(e)
+            raise e
+
+
+def decode_source(data):
+    # Same decoding and newline handling as read_source, for bytes that never touched the disk
+    return io.TextIOWrapper(io.BytesIO(data)).read()
+
+
+def stream_tarball_sources(fileobj, directory):
+    # Read a gzipped repository tarball as a stream and yield (file_path, source_code) for every
+    # indexable file as soon as its member has been read. Only .py members are written under
+    # directory (with the archive's top level folder stripped), nothing else is extracted.
+    links = []
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as tar:
+        for member in tar:
+            parts = member.name.split('/')[1:]
+            if not parts or not parts[-1].endswith('.py') or '..' in parts or member.name.startswith('/'):
+                continue
+            file_path = os.path.join(directory, *parts)
+            if member.issym() or member.islnk():
+                links.append((member, file_path))
+                continue
+            if not member.isfile():
+                continue
+            data = tar.extractfile(member).read()
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'wb') as source_file:
+                source_file.write(data)
+            if is_indexable_file(parts[-1]):
+                yield file_path, decode_source(data)
+    # Links can point at members later in the stream, so they are created once everything is on disk
+    for member, file_path in links:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if member.issym():
+            os.symlink(member.linkname, file_path)
+        else:
+            link_target = os.path.join(directory, *member.linkname.split('/')[1:])
+            if not os.path.isfile(link_target):
+                continue
+            os.link(link_target, file_path)
+        if is_indexable_file(os.path.basename(file_path)) and os.path.isfile(file_path):
+            yield file_path, read_source(file_path)
+
+
+def parse_source(file_path, source_code):
+    tree = parser.parse(bytes(source_code, "utf8"))
+    return {"file_path": file_path, "source_code": source_code, "tree": tree}
+
+
+def ingest_directory(directory):
+    # Walk the repository once and parse every indexable file, so the symbol, call graph,
+    # pydantic and endpoint passes all consume the same source and tree per file.
+    parsed_files = {}
+    for file_path in list_source_files(directory):
+        parsed_files[file_path] = parse_source(file_path, read_source(file_path))
+    return parsed_files
@@ -0,0 +1,165 @@
+import time
+import itertools
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueue:
+    """Runs blocking jobs on a fixed number of worker threads. At most max_queued jobs wait
+    for a worker; submit() refuses anything beyond that instead of letting the backlog grow,
+    so the caller can answer with a retryable status right away. A slot can also be reserved
+    up front for a job that is submitted later."""
+
+    def __init__(self, workers=4, max_queued=32, latency_window=256):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blast-radius")
+        self.slots = threading.BoundedSemaphore(workers + max_queued)
+        self.lock = threading.Lock()
+        self.reserved = 0
+        self.queued = 0
+        self.running = 0
+        self.counts = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        # Seconds spent waiting for a worker and running, for the most recent jobs
+        self.wait_times = deque(maxlen=latency_window)
+        self.run_times = deque(maxlen=latency_window)
+
+    def reserve(self):
+        # Takes a slot for a later submit(..., reserved=True); False when the queue is full
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.counts["rejected"] += 1
+            return False
+        with self.lock:
+            self.reserved += 1
+        return True
+
+    def release_reservation(self):
+        with self.lock:
+            self.reserved -= 1
+        self.slots.release()
+
+    def submit(self, function, *args, reserved=False):
+        # Returns False without queueing when every worker is busy and the queue is full
+        if not reserved and not self.reserve():
+            return False
+        with self.lock:
+            self.reserved -= 1
+            self.queued += 1
+            self.counts["submitted"] += 1
+        self.executor.submit(self._run, time.monotonic(), function, args)
+        return True
+
+    def _run(self, submitted_at, function, args):
+        started_at = time.monotonic()
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_times.append(started_at - submitted_at)
+        outcome = "completed"
+        try:
+            function(*args)
+        except Exception:
+            outcome = "failed"
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.counts[outcome] += 1
+                self.run_times.append(time.monotonic() - started_at)
+            self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "reserved": self.reserved,
+                "queued": self.queued,
+                "running": self.running,
+                **self.counts,
+                "wait_seconds": latency_summary(self.wait_times),
+                "run_seconds": latency_summary(self.run_times),
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+class Coalescer:
+    """Debounces jobs per key (a pull request) in front of a JobQueue. Every submit for a key
+    replaces the pending job and restarts its delay, so a burst of pushes becomes one job for
+    the newest event. A pull request holds one reserved JobQueue slot from its first pending
+    event until its job is queued, so an accepted event is never dropped for lack of room
+    later; submit() returns False instead. Threads cannot be interrupted, so a job that is already running gets an
+    is_superseded() callable instead; it turns true once a newer event or cancel() arrives,
+    and the job checks it before its expensive steps. Every event gets a token that is never
+    reused, so a job from before a cancel() stays superseded when the key comes back."""
+
+    def __init__(self, jobs, delay=5.0):
+        self.jobs = jobs
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.tokens = itertools.count(1)
+        # key -> token of the newest event, until its job finishes or the key is cancelled
+        self.latest = {}
+        self.timers = {}
+        self.counts = {"received": 0, "coalesced": 0, "cancelled": 0}
+
+    def submit(self, key, function, *args):
+        with self.lock:
+            timer = self.timers.pop(key, None)
+            if timer is None and not self.jobs.reserve():
+                return False
+            self.counts["received"] += 1
+            token = next(self.tokens)
+            self.latest[key] = token
+            if timer is not None:
+                # The replacement takes over the pending event's reserved slot
+                timer.cancel()
+                self.counts["coalesced"] += 1
+            timer = threading.Timer(self.delay, self._release, (key, token, function, args))
+            timer.daemon = True
+            self.timers[key] = timer
+            timer.start()
+        return True
+
+    def cancel(self, key):
+        # Drops the pending job and supersedes the running one, e.g. when the pull request closes
+        with self.lock:
+            timer = self.timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+                self.jobs.release_reservation()
+            if self.latest.pop(key, None) is not None:
+                self.counts["cancelled"] += 1
+
+    def _release(self, key, token, function, args):
+        with self.lock:
+            if self.latest.get(key) != token:
+                return
+            self.timers.pop(key, None)
+        self.jobs.submit(self._run, key, token, function, args, reserved=True)
+
+    def _run(self, key, token, function, args):
+        is_superseded = lambda: self.latest.get(key) != token
+        try:
+            function(*args, is_superseded)
+        finally:
+            with self.lock:
+                if self.latest.get(key) == token:
+                    del self.latest[key]
+
+    def stats(self):
+        with self.lock:
+            return {"pending": len(self.timers), **self.counts}
+
+
+def latency_summary(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+    percentile = lambda fraction: samples[min(len(samples) - 1, int(fraction * len(samples)))]
+    return {"count": len(samples), "p50": percentile(0.5), "p95": percentile(0.95), "max": samples[-1]}
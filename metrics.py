@@ -0,0 +1,69 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the stage duration histogram buckets
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+COUNTERS = {
+    "files_parsed_total": "Files parsed and extracted while indexing",
+    "indexed_nodes_total": "Function and class nodes extracted from the files index runs parsed",
+    "indexed_edges_total": "Call edges inserted by index runs, incremental runs only count changed edges",
+    "unresolved_calls_total": "Call sites that did not resolve to a known function",
+    "index_cache_hits_total": "Blast radius jobs that reused a cached index",
+    "index_cache_misses_total": "Blast radius jobs that had to build an index",
+}
+
+
+class Metrics:
+    """Process wide counters and per stage duration histograms, rendered in the Prometheus
+    text exposition format so the app can serve them without a client library."""
+
+    def __init__(self, prefix="momentum"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        # stage -> cumulative bucket counts followed by the observation count and sum
+        self.stages = {}
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.setdefault(stage, [0] * len(STAGE_BUCKETS) + [0, 0.0])
+            for position, upper_bound in enumerate(STAGE_BUCKETS):
+                if seconds <= upper_bound:
+                    histogram[position] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    @contextmanager
+    def time_stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def render(self, scraped={}):
+        # scraped maps a name to (type, help, value) for values other components report when scraped
+        lines = []
+        with self.lock:
+            for name, value in self.counters.items():
+                lines += [f"# HELP {self.prefix}_{name} {COUNTERS[name]}", f"# TYPE {self.prefix}_{name} counter", f"{self.prefix}_{name} {value}"]
+            name = f"{self.prefix}_stage_duration_seconds"
+            lines += [f"# HELP {name} Time spent in each stage of indexing and blast radius jobs", f"# TYPE {name} histogram"]
+            for stage, histogram in sorted(self.stages.items()):
+                for upper_bound, count in zip(STAGE_BUCKETS, histogram):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{upper_bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram[-2]}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram[-2]}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram[-1]}')
+        for name, (metric_type, help_text, value) in scraped.items():
+            lines += [f"# HELP {self.prefix}_{name} {help_text}", f"# TYPE {self.prefix}_{name} {metric_type}", f"{self.prefix}_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
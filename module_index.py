@@ -0,0 +1,44 @@
+class ModuleIndex:
+    """Candidate-file lookups for import resolution, built once per index run from the
+    files in file_index instead of walking the repository for every call site.
+
+    Every contiguous run of path segments (with the .py suffix dropped from the file name)
+    maps to the files containing it, in walk order, so a dotted module such as a.b.c is
+    answered by a single dictionary hit on "a/b/c"."""
+
+    def __init__(self, file_index):
+        self.files = list(file_index)
+        self.segment_runs = {}
+        for file_path in self.files:
+            for run in path_segment_runs(file_path):
+                self.segment_runs.setdefault(run, []).append(file_path)
+
+    def candidates(self, module_path):
+        # An empty module path (a top level import) can live in any file
+        if not module_path:
+            return self.files
+        return self.segment_runs.get(module_path.strip("/"), [])
+
+
+def path_segment_runs(file_path):
+    segments = [segment for segment in file_path[:-len(".py")].split("/") if segment]
+    runs = set()
+    for start in range(len(segments)):
+        for end in range(start + 1, len(segments) + 1):
+            runs.add("/".join(segments[start:end]))
+    return runs
+
+
+def split_import_module(module_value, file_path):
+    # Turn an imported module into the path fragment to look up and the imported name
+    if module_value.startswith('.'):
+        num_up_dirs = len(module_value) - len(module_value.lstrip('.'))  # Count the number of leading dots to determine relative depth
+        file_path_parts = file_path.split('/')[:-1]  # Remove the filename
+        # Use the last num_up_dirs elements from file_path_parts if num_up_dirs is not more than the length of file_path_parts
+        base_path_parts = file_path_parts[-num_up_dirs:] if num_up_dirs <= len(file_path_parts) else []
+        module_parts = module_value.lstrip('.').split('.')  # Remove leading dots and split
+        potential_module = '/'.join(base_path_parts + module_parts[:-1])  # Combine the paths
+    else:
+        module_parts = module_value.split('.')
+        potential_module = '/'.join(module_parts[:-1]) if len(module_parts) > 1 else ''
+    return potential_module, module_parts[-1]
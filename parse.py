@@ -1,7 +1,16 @@
-import os
 import json
+import time
+import hashlib
 import sqlite3
+import multiprocessing
 from endpoint_detection import EndpointManager
+from graph_writer import GraphWriter
+from impact_table import build_impact_table, drop_impact_table
+from csr_snapshot import write_snapshot
+from module_index import ModuleIndex, path_segment_runs, split_import_module
+from metrics import metrics
+from ingestion import list_source_files, parse_source, read_source, source_order
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 # from tree_sitter import Language, Parser
 from tree_sitter_languages import get_parser, get_language
@@ -25,6 +34,10 @@ def cleanup(directory: Optional[str]= "."):
         cursor.execute("DROP TABLE IF EXISTS endpoints")
         cursor.execute("DROP TABLE IF EXISTS nodes")
         cursor.execute("DROP TABLE IF EXISTS edges")
+        cursor.execute("DROP TABLE IF EXISTS files")
+        cursor.execute("DROP TABLE IF EXISTS node_degrees")
+        cursor.execute("DROP TABLE IF EXISTS scc")
+        cursor.execute("DROP TABLE IF EXISTS scc_edges")
         conn.commit()
         print("Tables dropped successfully.")
     except sqlite3.Error as e:
@@ -52,58 +65,94 @@ def _create_pydantic_table(directory: Optional[str] = "."):
         if conn:
             conn.close()
 
-def _create_explanation_table_if_not_exists(directory: Optional[str] = "."):
+def _create_files_table(directory: Optional[str] = "."):
     codebase_map = f"{directory}/.momentum/momentum.db"
     conn = sqlite3.connect(codebase_map, check_same_thread=False)
     cursor = conn.cursor()
     try:
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS explanation (
-                id INTEGER PRIMARY KEY,
-                identifier TEXT NOT NULL,
-                hash TEXT NOT NULL,
-                explanation TEXT NOT NULL,
-                UNIQUE(identifier, hash)
-            )
-        ''')
+        # Content hash and extracted record of every indexed file, for incremental runs
+        cursor.execute('''CREATE TABLE IF NOT EXISTS files (
+                            filepath TEXT PRIMARY KEY,
+                            hash TEXT,
+                            record TEXT
+                            )''')
         conn.commit()
+    except sqlite3.Error as e:
+        print("An error occurred:", e)
     finally:
         if conn:
             conn.close()
 
-def put_pydantic_class( filepath,classname,definition,directory: Optional[str] = "."):
+def _create_node_degrees_table(directory: Optional[str] = "."):
     codebase_map = f"{directory}/.momentum/momentum.db"
     conn = sqlite3.connect(codebase_map, check_same_thread=False)
     cursor = conn.cursor()
     try:
-
-        cursor.execute("INSERT OR REPLACE INTO pydantic (filepath,classname,definition) VALUES (?,?,?)", (filepath,classname,definition))
+        # Filled by GraphWriter.flush once all edges are written, so entry points need no traversal
+        cursor.execute('''CREATE TABLE IF NOT EXISTS node_degrees (
+                            id TEXT PRIMARY KEY,
+                            in_degree INTEGER,
+                            out_degree INTEGER,
+                            is_root INTEGER
+                            )''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS node_degrees_is_root ON node_degrees (is_root)")
         conn.commit()
-    except sqlite3.IntegrityError:
-        print(f"Pydantic class with identifier {classname} already exists. Skipping insert.")
+    except sqlite3.Error as e:
+        print("An error occurred:", e)
     finally:
         if conn:
             conn.close()
 
-
-
-
-
-def add_node_safe(directory, file_path, function_name, node, parameters, start, end, text, response=None):
+def _create_scc_tables(directory: Optional[str] = "."):
     codebase_map = f"{directory}/.momentum/momentum.db"
-    function_identifier = file_path.replace(directory, '') + ":" + function_name
+    conn = sqlite3.connect(codebase_map, check_same_thread=False)
+    cursor = conn.cursor()
     try:
-        graph.atomic(codebase_map, graph.upsert_node(function_identifier, {'file': file_path, 'parameters': parameters, "start": start, "end": end, "code": text, "response": response}))
-    except sqlite3.IntegrityError:
-        print(f"Node with identifier {function_identifier} already exists. Skipping insert.")
-        
-def add_class_node_safe(directory, file_path, class_name, start, end, text):
+        # Condensed call graph, filled by GraphWriter.flush. Component ids are in topological
+        # order, so every scc_edges row goes from a lower to a higher component.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS scc (
+                            id TEXT PRIMARY KEY,
+                            component INTEGER
+                            )''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS scc_component ON scc (component)")
+        cursor.execute('''CREATE TABLE IF NOT EXISTS scc_edges (
+                            source INTEGER,
+                            target INTEGER,
+                            PRIMARY KEY (source, target)
+                            )''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS scc_edges_target ON scc_edges (target)")
+        conn.commit()
+    except sqlite3.Error as e:
+        print("An error occurred:", e)
+    finally:
+        if conn:
+            conn.close()
+
+def _create_explanation_table_if_not_exists(directory: Optional[str] = "."):
     codebase_map = f"{directory}/.momentum/momentum.db"
-    function_identifier = file_path.replace(directory, '') + ":" + class_name
+    conn = sqlite3.connect(codebase_map, check_same_thread=False)
+    cursor = conn.cursor()
     try:
-        graph.atomic(codebase_map, graph.upsert_node(function_identifier, {'file': file_path, "start": start, "end": end, "code": text}))
-    except sqlite3.IntegrityError:
-        print(f"Node with identifier {function_identifier} already exists. Skipping insert.")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS explanation (
+                id INTEGER PRIMARY KEY,
+                identifier TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                explanation TEXT NOT NULL,
+                UNIQUE(identifier, hash)
+            )
+        ''')
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+def function_node_body(file_path, parameters, start, end, text, response=None):
+    return {'file': file_path, 'parameters': parameters, "start": start, "end": end, "code": text, "response": response}
+
+def class_node_body(file_path, start, end, text):
+    return {'file': file_path, "start": start, "end": end, "code": text}
+
         
 def get_node_text(node, source_code):
     start_byte = node.start_byte
@@ -124,6 +173,24 @@ def find_pydantic_class( node, pydantic_class_list, file_path):
         pydantic_class_list = find_pydantic_class(child, pydantic_class_list, file_path)
     return pydantic_class_list
 
+def extract_pydantic_candidates(node, candidates=None):
+    # Flatten a class subtree into (name, base identifiers, text) tuples in the order find_pydantic_class visits them,
+    # so the pydantic pass can run on plain data produced by a worker process.
+    if candidates is None:
+        candidates = []
+    if node.type == "class_definition":
+        base_names = [n.text.decode("utf8") for child in node.children for n in child.children if n.type == "identifier"]
+        candidates.append((node.children[1].text.decode('utf8'), base_names, node.text.decode('utf8')))
+    for child in node.children:
+        extract_pydantic_candidates(child, candidates)
+    return candidates
+
+def find_pydantic_class_from_candidates(candidates, pydantic_class_list, file_path):
+    for class_name, base_names, text in candidates:
+        if any(base_name == "BaseModel" or base_name in pydantic_class_list for base_name in base_names):
+            pydantic_class_list[class_name] = (file_path, text)
+    return pydantic_class_list
+
 def extract_parent_class(value):
     # Split the string to find the parent class name
     parts = value.split("(")
@@ -153,8 +220,9 @@ def append_parent_class(key, current_dict, original_dict, iteration=0):
             current_class_def = updated_class_def
         return updated_class_def
 
-def map_user_defined_functions(directory, source_code, file_path):
-    tree = parser.parse(bytes(source_code, "utf8"))
+def map_user_defined_functions(directory, source_code, file_path, tree=None):
+    if tree is None:
+        tree = parser.parse(bytes(source_code, "utf8"))
     root_node = tree.root_node
 
 
@@ -165,6 +233,7 @@ def map_user_defined_functions(directory, source_code, file_path):
     class_instances = {}
     file_imports = []  # Assuming this is defined somewhere above your provided code
     router_metadata = []
+    node_bodies = []
     for node in root_node.children:
 
         if node.type == 'import_from_statement' or node.type == "import_statement":
@@ -245,16 +314,7 @@ def map_user_defined_functions(directory, source_code, file_path):
                             depends_call = 'Depends' in grandchild.text.decode('utf8')
 
                             if depends_call:
-                                depends_text = grandchild.text.decode('utf8')
-                                start_index = 0
-                                while True:
-                                    start_index = depends_text.find('Depends(', start_index)
-                                    if start_index == -1:
-                                        break
-                                    start_index += len('Depends(')
-                                    end_index = depends_text.find(')', start_index)
-                                    depends_function_names.append(depends_text[start_index:end_index])
-                                    start_index = end_index
+                                depends_function_names = extract_depends_function_names(grandchild.text.decode('utf8'))
 
                             router_metadata.append({"router": router, "prefix": prefix, "depends": depends_function_names})
 
@@ -269,7 +329,7 @@ def map_user_defined_functions(directory, source_code, file_path):
             class_name = node.children[1].text.decode('utf8')  # Assuming the class name is always the second child
             class_context = class_name  # Set the current class context
             class_definition.append(class_name)
-            add_class_node_safe(directory, file_path, class_name, node.start_point, node.end_point, node.text.decode('utf8'))
+            node_bodies.append((file_path.replace(directory, '') + ":" + class_name, class_node_body(file_path, node.start_point, node.end_point, node.text.decode('utf8'))))
             class_nodes.append(node)
             for class_child in node.children:
                 if class_child.type == "block":
@@ -277,76 +337,148 @@ def map_user_defined_functions(directory, source_code, file_path):
                         if child.type in ['function_definition', 'decorated_definition']:
                             function_name, params, start, end, text, response = extract_function_metadata(child, [], class_context)
                             if function_name:
-                                add_node_safe(directory, file_path, function_name, node, params, start, end, text, response)
                                 function_identifier = file_path.replace(directory,'') + ":" + function_name
+                                node_bodies.append((function_identifier, function_node_body(file_path, params, start, end, text, response)))
                                 user_defined_functions[function_identifier] = child
 
         elif node.type == 'function_definition' or node.type == "decorated_definition":
             function_name, params, start, end, text, response = extract_function_metadata(node, [], None)
             if function_name:
-                add_node_safe(directory, file_path, function_name, node, params, start, end, text, response)
                 function_identifier = file_path.replace(directory,'') + ":" + function_name
+                node_bodies.append((function_identifier, function_node_body(file_path, params, start, end, text, response)))
                 user_defined_functions[function_identifier] = node
 
-    return user_defined_functions, file_imports, class_instances, class_definition, class_nodes, router_metadata
-
-# Process Function Calls and Update Edges
-def process_function_calls(directory, user_defined_functions, source_code, file_path, file_index):
+    return user_defined_functions, file_imports, class_instances, class_definition, class_nodes, router_metadata, node_bodies
 
-    for function_identifier, node in file_index[file_path]["functions"].items():
+def extract_file_record(directory, file_path, source_code, tree=None):
+    # Everything the later passes need from one file as plain picklable data, so it can be built in a worker process
+    if tree is None:
+        tree = parser.parse(bytes(source_code, "utf8"))
+    defined_functions, file_imports, class_instances, class_definition, class_nodes, router_prefixes, node_bodies = map_user_defined_functions(directory, source_code, file_path, tree)
+    functions = {}
+    calls = {}
+    for function_identifier, node in defined_functions.items():
         function_ref = function_identifier.split(":")[1]
         class_context = function_ref.split(".")[0] if "." in function_ref else None
-        traverse_node(directory, node, function_identifier, user_defined_functions, file_path, file_index, class_context)
+        functions[function_identifier] = function_ref
+        calls[function_identifier] = collect_call_sites(node, class_context)
+    pydantic_candidates = []
+    for class_node in class_nodes:
+        pydantic_candidates.append((class_node.text.decode('utf8'), extract_pydantic_candidates(class_node)))
+    record = {
+        "nodes": node_bodies,
+        "functions": functions,
+        "imports": file_imports,
+        "class_instances": class_instances,
+        "class_definition": class_definition,
+        "router_prefixes": router_prefixes,
+        "calls": calls,
+        "pydantic_candidates": pydantic_candidates,
+        "symbols": build_symbol_table(directory, file_path, file_imports, class_definition, functions),
+    }
+    record.update(EndpointManager(directory).extract_endpoint_record(file_path, source_code, tree))
+    return record
+
+def build_symbol_table(directory, file_path, file_imports, class_definition, functions):
+    # Hashed lookups for call resolution. An import is reachable by its alias and by every
+    # contiguous dotted run of its module, and the first import that matches a name wins.
+    imports = {}
+    for import_entry in file_imports:
+        module = import_entry["module"]
+        names = [import_entry["alias"]] if import_entry["alias"] else []
+        module_parts = module.split(".")
+        for start in range(len(module_parts)):
+            for end in range(start + 1, len(module_parts) + 1):
+                if all(module_parts[start:end]):
+                    names.append(".".join(module_parts[start:end]))
+        for name in names:
+            imports.setdefault(name, module)
+    file_identifier = file_path.replace(directory, '')
+    return {
+        "imports": imports,
+        "classes": {class_name: file_identifier + ":" + class_name for class_name in class_definition},
+        "functions": {function_identifier.split(":")[-1]: function_identifier for function_identifier in functions},
+    }
+
+def extract_file_batch(directory, batch):
+    # Process pool entry point: parse and extract a batch of (file_path, source_code) inside the worker
+    return [extract_file_record(directory, file_path, source_code) for file_path, source_code in batch]
 
+# Process Function Calls and Update Edges
+def process_function_calls(directory, user_defined_functions, file_path, file_index, file_calls, writer, module_index, resolution_cache=None):
+    # Resolved edges of the file with the number of call sites behind each
+    file_edges = {}
+    unresolved_calls = 0
+    for function_identifier, call_sites in file_calls.items():
+        for called_function in call_sites:
+            called_function_identifier = connect_nodes(function_identifier, called_function, user_defined_functions, directory, file_path, writer, file_index, module_index, resolution_cache)
+            if called_function_identifier:
+                edge = (function_identifier, called_function_identifier)
+                file_edges[edge] = file_edges.get(edge, 0) + 1
+            else:
+                unresolved_calls += 1
+    metrics.increment("unresolved_calls_total", unresolved_calls)
+    return [(source_id, target_id, count) for (source_id, target_id), count in file_edges.items()]
 
-def traverse_node(directory, node, parent_function, user_defined_functions, file_path, file_index, class_context=None):
-    codebase_map = f"{directory}/.momentum/momentum.db"
+
+def extract_depends_function_names(depends_text):
+    depends_function_names = []
+    start_index = 0
+    while True:
+        start_index = depends_text.find('Depends(', start_index)
+        if start_index == -1:
+            break
+        start_index += len('Depends(')
+        end_index = depends_text.find(')', start_index)
+        depends_function_names.append(depends_text[start_index:end_index])
+        start_index = end_index
+    return depends_function_names
+
+
+def collect_call_sites(node, class_context=None, call_sites=None):
+    # Raw names of everything a function calls or depends on, in traversal order, resolved later by connect_nodes
+    if call_sites is None:
+        call_sites = []
 
     depends_call = (node.type == 'default_parameter' and 'Depends' in node.text.decode('utf8') )
 
     if depends_call:
-        depends_text = node.text.decode('utf8')
-        depends_function_names = []
-        start_index = 0
-        while True:
-            start_index = depends_text.find('Depends(', start_index)
-            if start_index == -1:
-                break
-            start_index += len('Depends(')
-            end_index = depends_text.find(')', start_index)
-            depends_function_names.append(depends_text[start_index:end_index])
-            start_index = end_index
-        for functions in depends_function_names:
-            connect_nodes(parent_function, functions, user_defined_functions, directory, file_path, codebase_map, file_index)
+        call_sites.extend(extract_depends_function_names(node.text.decode('utf8')))
 
     if node.type == 'call':
         called_function = extract_called_function_name(node, class_context)
         if called_function:
             # Logic to handle method calls within the class context
-            connect_nodes(parent_function, called_function, user_defined_functions, directory, file_path, codebase_map, file_index)
+            call_sites.append(called_function)
 
     for child in node.children:
-        traverse_node(directory, child, parent_function, user_defined_functions, file_path, file_index, class_context)
+        collect_call_sites(child, class_context, call_sites)
+    return call_sites
 
-def connect_nodes(parent_function: str, called_function: str, user_defined_functions: dict, directory: str, file_path: str, codebase_map: dict, file_index: dict):
+def connect_nodes(parent_function: str, called_function: str, user_defined_functions: dict, directory: str, file_path: str, writer: GraphWriter, file_index: dict, module_index: ModuleIndex, resolution_cache: Optional[dict] = None):
     called_function_identifier = f"{file_path.replace(directory, '')}:{called_function}"
     if called_function_identifier in user_defined_functions:
-        graph.atomic(codebase_map, graph.connect_nodes(parent_function, called_function_identifier, {'action': 'calls'}))
+        writer.connect_nodes(parent_function, called_function_identifier, {'action': 'calls'})
+        return called_function_identifier
     else:
-        file_path, called_function = resolve_called_function_name(called_function, file_path, file_index, directory)
+        file_path, called_function = resolve_called_function_name(called_function, file_path, file_index, directory, module_index, resolution_cache)
         if called_function:
             called_function_identifier = f"{file_path.replace(directory, '')}:{called_function}"
             if called_function_identifier in user_defined_functions:
-                graph.atomic(codebase_map, graph.connect_nodes(parent_function, called_function_identifier, {'action': 'calls'}))
+                writer.connect_nodes(parent_function, called_function_identifier, {'action': 'calls'})
+                return called_function_identifier
+    return None
 
-def find_py_files_with_substring(dir_path, substring):
-    for root, dirs, files in os.walk(dir_path):
-        for file in files:
-            path = os.path.join(root, file)
-            if substring in path and file.endswith('.py') and not file.startswith("test"):
-                yield os.path.join(root, file)
+def resolve_called_function_name(name, file_path, file_index, directory, module_index, resolution_cache=None):
+    # The same names are resolved from the same file over and over, so answers are cached per (file_path, name)
+    if resolution_cache is None:
+        return _resolve_called_function_name(name, file_path, file_index, directory, module_index)
+    key = (file_path, name)
+    if key not in resolution_cache:
+        resolution_cache[key] = _resolve_called_function_name(name, file_path, file_index, directory, module_index)
+    return resolution_cache[key]
 
-def resolve_called_function_name(name, file_path, file_index, directory):
+def _resolve_called_function_name(name, file_path, file_index, directory, module_index):
     #handle DEPENDS later
     if len(name.split("."))>=2:
         instance = name.split(".")[0]
@@ -357,76 +489,38 @@ def resolve_called_function_name(name, file_path, file_index, directory):
         instance = name
     else :
         return file_path, None
-    if instance in file_index[file_path]["class_instances"].keys():
+    symbols = file_index[file_path]["symbols"]
+    if instance in file_index[file_path]["class_instances"]:
         class_context = file_index[file_path]["class_instances"][instance]
-        if class_context in file_index[file_path]["class_definition"]:
+        if class_context in symbols["classes"]:
             return file_path, class_context + "." + function
-        module_value = None
-        for import_entry in file_index[file_path]["imports"]:
-            if import_entry.get('alias') == class_context:
-                module_value = import_entry.get('module')
-                break
-            elif class_context in import_entry.get('module'):
-                module_value = import_entry.get('module')
-                break
+        module_value = symbols["imports"].get(class_context)
         if module_value:
-            if module_value.startswith('.'):
-                num_up_dirs = len(module_value) - len(module_value.lstrip('.'))  # Count the number of leading dots to determine relative depth
-                file_path_parts = file_path.split('/')[:-1]  # Remove the filename
-                # Use the last num_up_dirs elements from file_path_parts if num_up_dirs is not more than the length of file_path_parts
-                base_path_parts = file_path_parts[-num_up_dirs:] if num_up_dirs <= len(file_path_parts) else []
-                module_parts = module_value.lstrip('.').split('.')  # Remove leading dots and split
-                potential_module = '/'.join(base_path_parts + module_parts[:-1])  # Combine the paths
-            else:
-                module_parts = module_value.split('.')
-                potential_module = '/'.join(module_parts[:-1]) if len(module_parts) > 1 else ''
-            potential_class_or_instance = module_parts[-1]
-
-
-            candidate_files = list(find_py_files_with_substring(directory, potential_module))
-            for candidate_file in candidate_files:
-                candidate_path = os.path.join(directory, candidate_file)
-                if candidate_path in file_index:
-                    # Check if it's a class definition
-                    if potential_class_or_instance in file_index[candidate_path]["class_definition"]:
-                        return candidate_path, potential_class_or_instance + "." + function
-                    # Check if it's a class instance
-                    elif potential_class_or_instance in file_index[candidate_path]["class_instances"].keys():
-                        return candidate_path, file_index[candidate_path]["class_instances"][potential_class_or_instance] + "." + function
-        #TODO DEDUP   # If no class or instance match, return with the function appended
-    module_value = None
-    for import_entry in file_index[file_path]["imports"]:
-        if import_entry.get('alias') == instance:
-            module_value = import_entry.get('module')
-            break
-        elif instance in import_entry.get('module'):
-            module_value = import_entry.get('module')
-            break
-    if module_value:
-        if module_value.startswith('.'):
-            num_up_dirs = len(module_value) - len(module_value.lstrip('.'))  # Count the number of leading dots to determine relative depth
-            file_path_parts = file_path.split('/')[:-1]  # Remove the filename
-            # Use the last num_up_dirs elements from file_path_parts if num_up_dirs is not more than the length of file_path_parts
-            base_path_parts = file_path_parts[-num_up_dirs:] if num_up_dirs <= len(file_path_parts) else []
-            module_parts = module_value.lstrip('.').split('.')  # Remove leading dots and split
-            potential_module = '/'.join(base_path_parts + module_parts[:-1])  # Combine the paths
-        else:
-            module_parts = module_value.split('.')
-            potential_module = '/'.join(module_parts[:-1]) if len(module_parts) > 1 else ''
-        potential_class_or_instance = module_parts[-1]
-
-        candidate_files = list(find_py_files_with_substring(directory, potential_module))
-        for candidate_file in candidate_files:
-            candidate_path = os.path.join(directory, candidate_file)
-            if candidate_path in file_index:
+            potential_module, potential_class_or_instance = split_import_module(module_value, file_path)
+
+            for candidate_path in module_index.candidates(potential_module):
+                candidate_symbols = file_index[candidate_path]["symbols"]
                 # Check if it's a class definition
-                if potential_class_or_instance in file_index[candidate_path]["class_definition"]:
+                if potential_class_or_instance in candidate_symbols["classes"]:
                     return candidate_path, potential_class_or_instance + "." + function
                 # Check if it's a class instance
-                elif potential_class_or_instance in file_index[candidate_path]["class_instances"].keys():
+                elif potential_class_or_instance in file_index[candidate_path]["class_instances"]:
                     return candidate_path, file_index[candidate_path]["class_instances"][potential_class_or_instance] + "." + function
-                elif potential_class_or_instance in [key.split(":")[-1] for key in file_index[candidate_path]["functions"].keys()]:
-                    return candidate_path, potential_class_or_instance
+        #TODO DEDUP   # If no class or instance match, return with the function appended
+    module_value = symbols["imports"].get(instance)
+    if module_value:
+        potential_module, potential_class_or_instance = split_import_module(module_value, file_path)
+
+        for candidate_path in module_index.candidates(potential_module):
+            candidate_symbols = file_index[candidate_path]["symbols"]
+            # Check if it's a class definition
+            if potential_class_or_instance in candidate_symbols["classes"]:
+                return candidate_path, potential_class_or_instance + "." + function
+            # Check if it's a class instance
+            elif potential_class_or_instance in file_index[candidate_path]["class_instances"]:
+                return candidate_path, file_index[candidate_path]["class_instances"][potential_class_or_instance] + "." + function
+            elif potential_class_or_instance in candidate_symbols["functions"]:
+                return candidate_path, potential_class_or_instance
         # If no class or instance match, return with the function appended
     return file_path, None
 
@@ -496,80 +590,206 @@ def extract_function_metadata(node, parameters=[], class_context=None):
     return function_name, parameters, start, end, text, response
 
 
-#todo: optimise for single run
-def analyze_directory(directory):
+def hash_source(source_code):
+    return hashlib.sha1(source_code.encode("utf8")).hexdigest()
+
+def new_process_pool(workers):
+    # Indexing runs on job threads of the server, and forking a threaded process can copy a
+    # lock another thread holds into the child, so workers start from a clean forkserver
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+
+def build_file_records(directory, sources, is_changed, workers: Optional[int] = None, batch_size: int = 16):
+    # Consumes (file_path, source_code) pairs and extracts a record for every file where
+    # is_changed(file_path, content_hash) holds while the rest is still being read, so parsing
+    # overlaps with reading or downloading. With more than one worker, batches of files fan
+    # out to a process pool. Returns the content hash of every file and the changed records.
+    file_hashes = {}
+    changed_records = {}
+    executor = None
+    pending = []
+    batch = []
+    for file_path, source_code in sources:
+        file_hashes[file_path] = hash_source(source_code)
+        if not is_changed(file_path, file_hashes[file_path]):
+            continue
+        if not workers or workers <= 1:
+            parsed_file = parse_source(file_path, source_code)
+            changed_records[file_path] = extract_file_record(directory, file_path, parsed_file["source_code"], parsed_file["tree"])
+            continue
+        batch.append((file_path, source_code))
+        if len(batch) == batch_size:
+            if executor is None:
+                executor = new_process_pool(workers)
+            pending.append((batch, executor.submit(extract_file_batch, directory, batch)))
+            batch = []
+    if batch:
+        if executor is None and len(batch) == 1:
+            changed_records[batch[0][0]] = extract_file_record(directory, batch[0][0], batch[0][1])
+        else:
+            if executor is None:
+                executor = new_process_pool(workers)
+            pending.append((batch, executor.submit(extract_file_batch, directory, batch)))
+    if executor is not None:
+        with executor:
+            for batch, future in pending:
+                for (file_path, _), record in zip(batch, future.result()):
+                    changed_records[file_path] = record
+    return file_hashes, changed_records
+
+def defined_names(record):
+    # Names another file can reach through an import of this one
+    return set(record["symbols"]["classes"]) | set(record["class_instances"]) | set(record["symbols"]["functions"])
+
+def find_affected_files(directory, file_records, dirty_records, previous_edges):
+    # A file's call edges only depend on its own record and on which candidate files of its
+    # imports define the imported name. So besides the dirty files themselves, only files with
+    # an import that can land on a dirty file defining (or previously defining) that name, or
+    # with a stored edge into a dirty file, have to be resolved again.
+    dirty_files = {file_path.replace(directory, '') for file_path, _ in dirty_records}
+    dirty_names = {}
+    dirty_runs = {}
+    for file_path, record in dirty_records:
+        dirty_runs[file_path] = path_segment_runs(file_path)
+        for name in defined_names(record):
+            dirty_names.setdefault(name, set()).add(file_path)
+    affected = set()
+    for file_path, record in file_records.items():
+        if file_path.replace(directory, '') in dirty_files:
+            affected.add(file_path)
+            continue
+        if any(target.split(":")[0] in dirty_files for _, target, _ in previous_edges.get(file_path, [])):
+            affected.add(file_path)
+            continue
+        for module in set(record["symbols"]["imports"].values()):
+            potential_module, name = split_import_module(module, file_path)
+            if any(not potential_module or potential_module.strip("/") in dirty_runs[dirty_file] for dirty_file in dirty_names.get(name, ())):
+                affected.add(file_path)
+                break
+    return affected
+
+def analyze_directory(directory, workers: Optional[int] = None, incremental: bool = False, sources=None, edge_weights: bool = False, impact_table: bool = False):
+    # sources optionally supplies (file_path, source_code) pairs, e.g. streamed from a tarball,
+    # instead of reading the indexable files under directory
     db_path = f"{directory}/.momentum/momentum.db"
-    cleanup(directory)
+    if not incremental:
+        cleanup(directory)
     graph.initialize(db_path)
     _create_pydantic_table(directory)
     _create_explanation_table_if_not_exists(directory)
+    _create_files_table(directory)
+    _create_node_degrees_table(directory)
+    _create_scc_tables(directory)
+    EndpointManager(directory).setup_database()
     user_defined_functions = {}
     file_index = {}
     all_class_definitions = []
     pydantic_classes = {}
-    for subdir, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.py') and not file.startswith("test"):
-
-                file_path = os.path.join(subdir, file)
-                with open(file_path, 'r') as source_file:
-                    try:
-                        source_code = source_file.read()
-                    except Exception as e:
-                        print(e)
-                        raise e
-                    defined_functions, file_imports, class_instances, class_definition, class_nodes, router_prefixes = map_user_defined_functions(directory, source_code, file_path)
-                    user_defined_functions.update(defined_functions)
-                    file_index[file_path] = {"imports": file_imports, "class_instances": class_instances, "class_definition": class_definition, "functions": defined_functions, "router_prefixes": router_prefixes}
-                    for class_def in class_nodes:
-                        all_class_definitions.append( (file_path, class_def))
-
+    writer = GraphWriter(db_path, replace=True, edge_weights=edge_weights)
+
+    # Only files whose content hash differs from the previous run are parsed again, the rest
+    # are restored from the records stored with that run
+    previous_files = writer.get_file_records()
+    if sources is None:
+        sources = ((file_path, read_source(file_path)) for file_path in list_source_files(directory))
+    def is_changed(file_path, content_hash):
+        return previous_files.get(file_path.replace(directory, ''), (None,))[0] != content_hash
+    with metrics.time_stage("extract"):
+        file_hashes, changed_records = build_file_records(directory, sources, is_changed, workers)
+    metrics.increment("files_parsed_total", len(changed_records))
+    metrics.increment("indexed_nodes_total", sum(len(record.get("nodes", [])) for record in changed_records.values()))
+    # Records are merged in path order whatever order the sources arrived in
+    file_hashes = {file_path: file_hashes[file_path] for file_path in sorted(file_hashes, key=source_order)}
+    changed_files = [file_path for file_path in file_hashes if file_path in changed_records]
+    removed_files = [file_identifier for file_identifier in previous_files if directory + file_identifier not in file_hashes]
+    dirty_records = []
+    for file_identifier in [file_path.replace(directory, '') for file_path in changed_files] + removed_files:
+        if file_identifier in previous_files:
+            dirty_records.append((directory + file_identifier, json.loads(previous_files[file_identifier][1])))
+    writer.remove_file_nodes([file_path.replace(directory, '') for file_path in changed_files] + removed_files)
+    for file_identifier in removed_files:
+        writer.remove_file_record(file_identifier)
+
+    file_records = {}
+    previous_edges = {}
+    for file_path in file_hashes:
+        if file_path in changed_records:
+            file_records[file_path] = changed_records[file_path]
+            dirty_records.append((file_path, changed_records[file_path]))
+        else:
+            file_records[file_path] = json.loads(previous_files[file_path.replace(directory, '')][1])
+            previous_edges[file_path] = file_records[file_path].pop("edges")
+    for file_path, record in file_records.items():
+        for function_identifier, body in record.get("nodes", []):
+            writer.upsert_node(function_identifier, body)
+        user_defined_functions.update(record["functions"])
+        file_index[file_path] = {"imports": record["imports"], "class_instances": record["class_instances"], "class_definition": record["class_definition"], "functions": record["functions"], "router_prefixes": record["router_prefixes"], "symbols": record["symbols"]}
+        for class_text, candidates in record["pydantic_candidates"]:
+            all_class_definitions.append( (file_path, class_text, candidates))
+
+    stage_start = time.perf_counter()
     pydantic_class_list = {}
     depth = 4
     while depth >= 0:
-        for  (file_path, cl_def) in all_class_definitions:
-            if cl_def.text.decode('utf8') not in pydantic_class_list:
-                pydantic_classes = find_pydantic_class(cl_def, pydantic_class_list, file_path)
+        for  (file_path, class_text, candidates) in all_class_definitions:
+            if class_text not in pydantic_class_list:
+                pydantic_classes = find_pydantic_class_from_candidates(candidates, pydantic_class_list, file_path)
         depth -= 1
     updated_pydantic = {}
 
     for key, value in pydantic_classes.items():
             updated_pydantic[key] = value[0], append_parent_class(key, pydantic_classes, pydantic_classes)
     for key, value in updated_pydantic.items():
-        put_pydantic_class(value[0], key, value[1], directory)
+        writer.put_pydantic_class(value[0], key, value[1])
+    metrics.observe("pydantic", time.perf_counter() - stage_start)
+    stage_start = time.perf_counter()
     router_metadata_file_mapping = {}
-    for subdir, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.py') and not file.startswith("test"):
-                file_path = os.path.join(subdir, file)
-                with open(file_path, 'r') as source_file:
-                    source_code = source_file.read()
-                    process_function_calls(directory, user_defined_functions, source_code, file_path, file_index)
-                for router_prefix in file_index[file_path]["router_prefixes"]:
-                    if not router_prefix == []:
-                        router = router_prefix["router"]
-                        prefix = router_prefix["prefix"]
-                        depends = router_prefix["depends"]
-                        router_name = resolve_called_function_name(router, file_path, file_index, directory)
-                        if router_name:
-                            router_file = router_name[0].replace(directory, '')
-                            router_dependencies = {}
-                            if router_name[0] not in router_dependencies:
-                                router_dependencies[router_name[0]] = []
-                            if not depends == []:
-                                for dependency in depends:
-                                    called_function_identifier = f"{file_path.replace(directory, '')}:{dependency}"
-                                    if called_function_identifier in user_defined_functions:
-                                        router_dependencies[router_name[0]].append(called_function_identifier)
-                                    else:
-                                        path,name = resolve_called_function_name(dependency, file_path, file_index, directory)
-                                        function_identifier = f"{path.replace(directory, '')}:{name}"
-                                        if name:
-                                            router_dependencies[router_name[0]].append(function_identifier)
-                            dep = router_dependencies[router_name[0]] if router_name[0] in router_dependencies else []
-                            router_metadata_file_mapping[router_file] = { "prefix": prefix, "depends": dep }
-
-
-
-    EndpointManager(directory, file_index,router_metadata_file_mapping).analyse_endpoints()
+    module_index = ModuleIndex(file_index)
+    resolution_cache = {}
+    affected_files = find_affected_files(directory, file_records, dirty_records, previous_edges)
+    for file_path, record in file_records.items():
+        if file_path in affected_files:
+            file_edges = process_function_calls(directory, user_defined_functions, file_path, file_index, record["calls"], writer, module_index, resolution_cache)
+            record = {key: value for key, value in record.items() if key != "nodes"}
+            record["edges"] = file_edges
+            writer.put_file_record(file_path.replace(directory, ''), file_hashes[file_path], record)
+        else:
+            for source_id, target_id, count in previous_edges[file_path]:
+                writer.connect_nodes(source_id, target_id, {'action': 'calls'}, count)
+        for router_prefix in file_index[file_path]["router_prefixes"]:
+            if not router_prefix == []:
+                router = router_prefix["router"]
+                prefix = router_prefix["prefix"]
+                depends = router_prefix["depends"]
+                router_name = resolve_called_function_name(router, file_path, file_index, directory, module_index, resolution_cache)
+                if router_name:
+                    router_file = router_name[0].replace(directory, '')
+                    router_dependencies = {}
+                    if router_name[0] not in router_dependencies:
+                        router_dependencies[router_name[0]] = []
+                    if not depends == []:
+                        for dependency in depends:
+                            called_function_identifier = f"{file_path.replace(directory, '')}:{dependency}"
+                            if called_function_identifier in user_defined_functions:
+                                router_dependencies[router_name[0]].append(called_function_identifier)
+                            else:
+                                path,name = resolve_called_function_name(dependency, file_path, file_index, directory, module_index, resolution_cache)
+                                function_identifier = f"{path.replace(directory, '')}:{name}"
+                                if name:
+                                    router_dependencies[router_name[0]].append(function_identifier)
+                    dep = router_dependencies[router_name[0]] if router_name[0] in router_dependencies else []
+                    router_metadata_file_mapping[router_file] = { "prefix": prefix, "depends": dep }
+    metrics.observe("call_graph", time.perf_counter() - stage_start)
+
+    with metrics.time_stage("endpoints"):
+        EndpointManager(directory, file_index,router_metadata_file_mapping, file_records, writer, module_index).analyse_endpoints()
+    print(f"Indexed {len(changed_files)} changed and {len(removed_files)} removed files, resolved calls in {len(affected_files)} files.")
+    with metrics.time_stage("write"):
+        writer.flush()
+        metrics.increment("indexed_edges_total", writer.written_edges)
+        writer.close()
+        write_snapshot(directory)
+        if impact_table:
+            build_impact_table(directory)
+        else:
+            drop_impact_table(directory)
 